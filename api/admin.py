@@ -1,4 +1,7 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from .models import (
     User,
     Classroom,
@@ -7,18 +10,145 @@ from .models import (
     Submission,
     ClassChatMessage,
     DirectChatMessage,
+    Notification,
+    Task,
+    ProvisionJob,
 )
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from .deletion import delete_classroom, delete_user
+
+
+class SoftDeleteAdmin:
+    """Admin deletes go through the soft delete + background purge."""
+
+    soft_delete = None
+
+    def delete_model(self, request, obj):
+        self.soft_delete(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.soft_delete(obj)
+
+    def get_deleted_objects(self, objs, request):
+        # don't walk every related row for the confirmation page
+        return [str(obj) for obj in objs], {}, set(), []
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Unfiltered changelists on big postgres tables use the planner's row
+    estimate (pg_class.reltuples, summed over partitions) instead of COUNT(*).
+    """
+
+    threshold = 100_000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if not qs.query.where and connections[qs.db].vendor == "postgresql":
+            estimate = self.estimate(qs)
+            if estimate > self.threshold:
+                return estimate
+        return super().count
+
+    @staticmethod
+    def estimate(qs):
+        table = qs.model._meta.db_table
+        with connections[qs.db].cursor() as cursor:
+            cursor.execute(
+                "SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint "
+                "FROM pg_class c WHERE c.oid = %s::regclass OR c.oid IN "
+                "(SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass)",
+                [table, table],
+            )
+            return cursor.fetchone()[0]
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # skip the second, unfiltered COUNT(*) on filtered pages
+    show_full_result_count = False
+    list_per_page = 50
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(SoftDeleteAdmin, BaseUserAdmin):
+    soft_delete = staticmethod(delete_user)
     fieldsets = BaseUserAdmin.fieldsets + (("Extra", {"fields": ("is_teacher",)}),)
 
 
-admin.site.register(Classroom)
-admin.site.register(Material)
-admin.site.register(Enrollment)
-admin.site.register(Submission)
-admin.site.register(ClassChatMessage)
-admin.site.register(DirectChatMessage)
+@admin.register(Classroom)
+class ClassroomAdmin(SoftDeleteAdmin, admin.ModelAdmin):
+    soft_delete = staticmethod(delete_classroom)
+    list_display = ("title", "teacher", "join_token", "created_at")
+    list_select_related = ("teacher",)
+    raw_id_fields = ("teacher",)
+
+
+@admin.register(Material)
+class MaterialAdmin(admin.ModelAdmin):
+    list_display = ("title", "classroom", "created_at")
+    list_select_related = ("classroom__teacher",)
+    raw_id_fields = ("classroom",)
+
+
+@admin.register(Enrollment)
+class EnrollmentAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "classroom", "joined_at")
+    list_select_related = ("user", "classroom__teacher")
+    raw_id_fields = ("user", "classroom")
+    ordering = ("-id",)
+
+
+@admin.register(Submission)
+class SubmissionAdmin(LargeTableAdmin):
+    list_display = ("id", "student", "material", "graded", "grade", "created_at")
+    list_select_related = ("student", "material__classroom")
+    raw_id_fields = ("student", "material")
+    list_filter = ("graded",)
+    date_hierarchy = "created_at"
+    ordering = ("-created_at",)
+
+
+@admin.register(ClassChatMessage)
+class ClassChatMessageAdmin(LargeTableAdmin):
+    list_display = ("id", "sender", "material", "timestamp")
+    list_select_related = ("sender", "material__classroom")
+    raw_id_fields = ("sender", "material")
+    date_hierarchy = "timestamp"
+    ordering = ("-id",)
+
+
+@admin.register(DirectChatMessage)
+class DirectChatMessageAdmin(LargeTableAdmin):
+    list_display = ("id", "sender", "recipient", "timestamp")
+    list_select_related = ("sender", "recipient")
+    raw_id_fields = ("sender", "recipient")
+    date_hierarchy = "timestamp"
+    ordering = ("-id",)
+
+
+@admin.register(Notification)
+class NotificationAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "kind", "is_read", "created_at")
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
+    ordering = ("-id",)
+
+
+@admin.register(Task)
+class TaskAdmin(LargeTableAdmin):
+    list_display = ("id", "name", "status", "attempts", "run_at", "updated_at")
+    list_filter = ("status",)
+    ordering = ("-id",)
+
+
+@admin.register(ProvisionJob)
+class ProvisionJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "requested_by", "status", "created", "failed", "created_at")
+    list_filter = ("status",)
+    raw_id_fields = ("requested_by", "classroom")
+    # the submitted rows hold passwords
+    exclude = ("rows",)
+    ordering = ("-created_at",)
@@ -0,0 +1,283 @@
+"""
+Monthly partitions and cold-storage archive for the chat tables.
+
+On PostgreSQL ``api_classchatmessage`` and ``api_directchatmessage`` are
+range-partitioned by month on ``timestamp`` (see migration 0005). Months older
+than the retention window are written to gzipped JSONL files, one file per
+thread, recorded in ``ChatArchive`` and then dropped from the database. Paging
+back through a chat list (``?before=<id>``) continues into the archive once
+the table runs out, reading only as many files as the page needs.
+"""
+
+import gzip
+import json
+import os
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+from .models import ChatArchive, ClassChatMessage, DirectChatMessage
+
+User = get_user_model()
+
+CLASS = ChatArchive.CLASS
+DIRECT = ChatArchive.DIRECT
+
+MODELS = {CLASS: ClassChatMessage, DIRECT: DirectChatMessage}
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def direct_thread(a, b):
+    # same canonical order as the direct chat websocket group
+    a, b = sorted([str(a), str(b)])
+    return f"{a}_{b}"
+
+
+def is_partitioned(table):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [table])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y_%m}"
+
+
+def create_partition(cursor, table, month):
+    """
+    Create the partition for ``month``. Rows that already landed in the
+    default partition for that range are moved into it first.
+    """
+    name = partition_name(table, month)
+    start, end = month, add_months(month, 1)
+    cursor.execute("SELECT 1 FROM pg_class WHERE relname = %s", [name])
+    if cursor.fetchone():
+        return False
+    cursor.execute(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM "{table}_default" '
+        f'WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+        f'INSERT INTO "{name}" SELECT * FROM moved',
+        [start, end],
+    )
+    cursor.execute(
+        f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" '
+        f"FOR VALUES FROM (%s) TO (%s)",
+        [start, end],
+    )
+    return True
+
+
+def ensure_partitions(months_ahead=3, now=None):
+    """Create partitions from the current month up to ``months_ahead``."""
+    created = []
+    first = month_start(now or timezone.now())
+    for model in MODELS.values():
+        table = model._meta.db_table
+        if not is_partitioned(table):
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            for i in range(months_ahead + 1):
+                month = add_months(first, i)
+                if create_partition(cursor, table, month):
+                    created.append(partition_name(table, month))
+    return created
+
+
+def archive_path(kind, month, thread, first_id):
+    return os.path.join(
+        settings.CHAT_ARCHIVE_DIR,
+        kind,
+        f"{month:%Y-%m}",
+        f"{thread}-{first_id}.jsonl.gz",
+    )
+
+
+def month_rows(kind, month):
+    """Rows of one month ordered by thread, then id."""
+    model = MODELS[kind]
+    qs = model.objects.filter(timestamp__gte=month, timestamp__lt=add_months(month, 1))
+    if kind == CLASS:
+        qs = qs.annotate(thread=F("material_id")).order_by("material_id", "id")
+        fields = ("id", "thread", "sender_id", "content", "timestamp")
+    else:
+        qs = qs.annotate(
+            low=Least("sender_id", "recipient_id"),
+            high=Greatest("sender_id", "recipient_id"),
+        ).order_by("low", "high", "id")
+        fields = (
+            "id",
+            "low",
+            "high",
+            "sender_id",
+            "recipient_id",
+            "content",
+            "timestamp",
+        )
+    for row in qs.values(*fields).iterator(chunk_size=2000):
+        if kind == DIRECT:
+            row["thread"] = direct_thread(row.pop("low"), row.pop("high"))
+        else:
+            row["thread"] = str(row["thread"])
+        yield row
+
+
+def write_month(kind, month):
+    """Write one month to per-thread files, return unsaved ChatArchive rows."""
+    entries = []
+    current = None
+    out = None
+
+    def close():
+        if out is not None:
+            out.close()
+            os.replace(current.path + ".tmp", current.path)
+
+    try:
+        for row in month_rows(kind, month):
+            thread = row.pop("thread")
+            if current is None or current.thread != thread:
+                close()
+                path = archive_path(kind, month, thread, row["id"])
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                out = gzip.open(path + ".tmp", "wt", encoding="utf-8")
+                current = ChatArchive(
+                    kind=kind,
+                    month=month.date(),
+                    thread=thread,
+                    path=path,
+                    row_count=0,
+                    first_id=row["id"],
+                )
+                entries.append(current)
+            row["timestamp"] = row["timestamp"].isoformat()
+            out.write(json.dumps(row) + "\n")
+            current.row_count += 1
+            current.last_id = row["id"]
+        close()
+    except BaseException:
+        if out is not None:
+            out.close()
+        raise
+    return entries
+
+
+def drop_month(kind, month):
+    model = MODELS[kind]
+    table = model._meta.db_table
+    if is_partitioned(table):
+        name = partition_name(table, month)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_class WHERE relname = %s", [name])
+            if cursor.fetchone():
+                cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+                cursor.execute(f'DROP TABLE "{name}"')
+                return
+    # not partitioned (or rows sit in the default partition)
+    model.objects.filter(
+        timestamp__gte=month, timestamp__lt=add_months(month, 1)
+    ).delete()
+
+
+def archive_before(cutoff, kinds=(CLASS, DIRECT)):
+    """Archive and drop every month that ends before ``cutoff``."""
+    archived = []
+    cutoff = month_start(cutoff)
+    for kind in kinds:
+        old = MODELS[kind].objects.filter(timestamp__lt=cutoff).order_by("timestamp")
+        # archived months are dropped, so this walks months that have rows only
+        while (oldest := old.values_list("timestamp", flat=True).first()) is not None:
+            month = month_start(oldest)
+            with transaction.atomic():
+                entries = write_month(kind, month)
+                ChatArchive.objects.bulk_create(entries)
+                drop_month(kind, month)
+            archived.append((kind, month, sum(e.row_count for e in entries)))
+    return archived
+
+
+def read_archived(kind, threads, before, limit):
+    """
+    The newest ``limit`` archived rows of ``threads`` (a Q on ChatArchive)
+    older than id ``before``, oldest first. Files are opened newest first and
+    only until the page is full.
+    """
+    entries = ChatArchive.objects.filter(threads, kind=kind, first_id__lt=before)
+    rows = []
+    for entry in entries.order_by("-last_id").iterator():
+        if len(rows) >= limit and entry.last_id < rows[-1]["id"]:
+            break
+        with gzip.open(entry.path, "rt", encoding="utf-8") as f:
+            rows.extend(row for row in map(json.loads, f) if row["id"] < before)
+        rows.sort(key=lambda row: row["id"], reverse=True)
+        del rows[limit:]
+    rows.reverse()
+    return rows
+
+
+def user_threads(user_id):
+    return Q(thread__startswith=f"{user_id}_") | Q(thread__endswith=f"_{user_id}")
+
+
+def delete_archives(kind, threads):
+    """Remove the archived files of ``threads`` (a Q on ChatArchive) and their rows."""
+    entries = ChatArchive.objects.filter(threads, kind=kind)
+    paths = list(entries.values_list("path", flat=True))
+    entries.delete()
+    # rows first: a reader never gets an entry whose file is gone
+    transaction.on_commit(lambda: remove_files(paths))
+    return len(paths)
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def serialize_archived(rows, kind):
+    """Shape archived rows like the chat message serializers do."""
+    from .serializers import UserSerializer
+
+    senders = User.objects.in_bulk({row["sender_id"] for row in rows})
+    users = {pk: UserSerializer(user).data for pk, user in senders.items()}
+    data = []
+    for row in rows:
+        item = {"id": row["id"]}
+        if kind == CLASS:
+            item["material"] = row["material_id"]
+        item["sender"] = users.get(row["sender_id"])
+        if kind == DIRECT:
+            item["recipient"] = row["recipient_id"]
+        item["content"] = row["content"]
+        item["timestamp"] = row["timestamp"].replace("+00:00", "Z")
+        data.append(item)
+    return data
+
+
+def archived_class_messages(material_id, before, limit):
+    rows = read_archived(CLASS, Q(thread=str(material_id)), before, limit)
+    for row in rows:
+        row["material_id"] = str(material_id)
+    return serialize_archived(rows, CLASS)
+
+
+def archived_direct_messages(user_id, before, limit):
+    rows = read_archived(DIRECT, user_threads(user_id), before, limit)
+    return serialize_archived(rows, DIRECT)
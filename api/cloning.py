@@ -0,0 +1,45 @@
+"""
+Copy a classroom for a new term (``POST /api/classrooms/<id>/clone/``).
+
+Runs in one transaction with a fixed number of queries however many
+materials the classroom has: the copy gets a fresh join token, its
+materials are inserted with one ``bulk_create``, enrollments optionally too.
+"""
+
+from django.db import transaction
+from .models import ChangeLog, Classroom, Enrollment, Material
+from .sync import record_many
+
+
+def clone_classroom(source, title=None, copy_enrollments=False):
+    with transaction.atomic():
+        # join_token comes from the field default, never copied
+        classroom = Classroom.objects.create(
+            teacher_id=source.teacher_id,
+            title=title or source.title,
+            description=source.description,
+        )
+        materials = Material.objects.bulk_create(
+            Material(classroom=classroom, title=name, youtube_url=youtube_url)
+            for name, youtube_url in source.materials.order_by(
+                "created_at"
+            ).values_list("title", "youtube_url")
+        )
+        # bulk_create skips post_save, log for delta sync here
+        entries = [
+            ("material", m.pk, classroom.pk, ChangeLog.UPSERT, None) for m in materials
+        ]
+        if copy_enrollments:
+            enrollments = Enrollment.objects.bulk_create(
+                Enrollment(classroom=classroom, user_id=user_id)
+                for user_id in source.enrollments.values_list("user_id", flat=True)
+            )
+            if any(e.pk is None for e in enrollments):
+                # backends without RETURNING don't set pks on bulk_create
+                enrollments = classroom.enrollments.all()
+            entries.extend(
+                ("enrollment", e.pk, classroom.pk, ChangeLog.UPSERT, e.user_id)
+                for e in enrollments
+            )
+        record_many(entries)
+    return classroom
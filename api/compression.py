@@ -0,0 +1,81 @@
+"""
+Response compression: brotli when the client accepts it and ``brotli`` is
+installed, gzip otherwise. Only JSON API responses are compressed: HTML
+(admin, browsable API, login forms) carries CSRF tokens next to reflected
+input, which compression would expose to BREACH. Small, already encoded and
+streaming responses (SSE) are passed through untouched.
+"""
+
+import gzip
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+# below this the headers cost more than compression saves
+MIN_LENGTH = 1024
+COMPRESSIBLE_TYPES = {"application/json"}
+
+
+def encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding):
+    """Pick our preferred encoding among those the client accepts (q > 0)."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in encodings():
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding, best=False):
+    # best=True for bytes compressed once and served many times
+    if encoding == "br":
+        return brotli.compress(data, quality=9 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+def compressible(content_type):
+    media_type = content_type.split(";")[0].strip().lower()
+    return media_type in COMPRESSIBLE_TYPES or media_type.endswith("+json")
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if (
+            response.streaming
+            or response.has_header("Content-Encoding")
+            or not compressible(response.get("Content-Type", ""))
+            or len(response.content) < MIN_LENGTH
+        ):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+        body = compress(response.content, encoding)
+        if len(body) >= len(response.content):
+            return response
+        response.content = body
+        response.headers["Content-Length"] = str(len(body))
+        response.headers["Content-Encoding"] = encoding
+        # the compressed body is a different representation
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        return response
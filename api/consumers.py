@@ -1,113 +1,296 @@
-import json
+import time
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from asgiref.sync import sync_to_async
+from channels.db import aclose_old_connections
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from . import framing
+from .notifications import students_group, user_group
+from .readstate import mark_read
+from .dbrouting import amark_write, areplica_allowed, reads_from_replica
+from .membership import aget_membership
 from .models import Material, ClassChatMessage, DirectChatMessage
 
 User = get_user_model()
 
+# how often (seconds) a worker re-checks its db connection between messages
+CONNECTION_CHECK_INTERVAL = 10
+HISTORY_LIMIT = 100
 
-class MaterialChatConsumer(AsyncWebsocketConsumer):
+_last_connection_check = 0.0
+
+
+async def ensure_fresh_connection(force=False):
+    """
+    Async ORM calls do not clean up connections like database_sync_to_async,
+    so drop stale/broken ones here, at most once per interval per process.
+    """
+    global _last_connection_check
+    now = time.monotonic()
+    if force or now - _last_connection_check >= CONNECTION_CHECK_INTERVAL:
+        _last_connection_check = now
+        await aclose_old_connections()
+
+
+def material_group(material_id):
+    return f"material_{material_id}"
+
+
+def direct_group(user_id, other_user_id):
+    # canonical room: smallerid_biggerid
+    ids = sorted([str(user_id), str(other_user_id)])
+    return f"direct_{ids[0]}_{ids[1]}"
+
+
+def class_message_payload(msg):
+    return {
+        "id": msg.id,
+        "message": msg.content,
+        "sender": msg.sender.username,
+        "sender_id": msg.sender_id,
+    }
+
+
+def direct_message_payload(msg):
+    return {
+        "id": msg.id,
+        "message": msg.content,
+        "sender": msg.sender.username,
+        "sender_id": msg.sender_id,
+        "recipient_id": msg.recipient_id,
+    }
+
+
+async def can_join_material(scope, material_id):
+    """Only members of the material's classroom may listen or post."""
+    if not scope["user"].is_authenticated:
+        return False
+    await ensure_fresh_connection()
+    try:
+        classroom_id = (
+            await Material.objects.filter(id=material_id)
+            .values_list("classroom_id", flat=True)
+            .afirst()
+        )
+    except ValidationError:  # not a uuid
+        return False
+    membership = await aget_membership(scope)
+    return classroom_id is not None and membership.is_member(classroom_id)
+
+
+def history_limit(scope):
+    # ws/...?history=50 -> send last 50 messages after connect
+    qs = parse_qs(scope.get("query_string", b"").decode())
+    try:
+        return max(0, min(int(qs.get("history", ["0"])[0]), HISTORY_LIMIT))
+    except ValueError:
+        return 0
+
+
+class FramedConsumer(AsyncWebsocketConsumer):
+    """
+    Negotiates the frame encoding (see api.framing) on connect and
+    encodes/decodes every frame with it.
+    """
+
+    protocol = None
+
+    async def accept_framed(self):
+        self.protocol = framing.negotiate(self.scope.get("subprotocols"))
+        await self.accept(subprotocol=self.protocol)
+
+    async def send_payload(self, payload):
+        text_data, bytes_data = framing.encode(payload, self.protocol)
+        await self.send(text_data=text_data, bytes_data=bytes_data)
+
+    async def send_event(self, event):
+        text_data, bytes_data = framing.encode_event(event, self.protocol)
+        await self.send(text_data=text_data, bytes_data=bytes_data)
+
+    def decode(self, text_data, bytes_data):
+        return framing.decode(text_data, bytes_data, self.protocol)
+
+    async def receive_read(self, user, data, **thread):
+        # {"type": "read", "last_read_id": 123} moves the read watermark
+        try:
+            last_read_id = int(data.get("last_read_id"))
+        except (TypeError, ValueError):
+            await self.send_payload({"error": "last_read_id required"})
+            return
+        await ensure_fresh_connection()
+        await sync_to_async(mark_read)(user.id, last_read_id, **thread)
+        await amark_write(user.id)
+
+
+class MaterialChatConsumer(FramedConsumer):
     async def connect(self):
         self.material_id = self.scope["url_route"]["kwargs"]["material_id"]
-        self.room_group_name = f"material_{self.material_id}"
+        self.room_group_name = material_group(self.material_id)
+        if not await can_join_material(self.scope, self.material_id):
+            await self.close()
+            return
 
-        # optionally check if user is enrolled in the class for security
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
+        await self.accept_framed()
+
+        limit = history_limit(self.scope)
+        if limit:
+            await ensure_fresh_connection()
+            user_id = self.scope["user"].id
+            with reads_from_replica(await areplica_allowed(user_id)):
+                await self.send_history(limit)
 
     async def disconnect(self, code):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await ensure_fresh_connection(force=True)
+
+    async def send_history(self, limit):
+        qs = (
+            ClassChatMessage.objects.filter(material_id=self.material_id)
+            .select_related("sender")
+            .order_by("-timestamp")[:limit]
+        )
+        messages = [class_message_payload(msg) async for msg in qs]
+        messages.reverse()
+        await self.send_payload({"history": messages})
 
     async def receive(self, text_data=None, bytes_data=None):
-        data = json.loads(text_data)
+        data = self.decode(text_data, bytes_data)
         message = data.get("message")
 
         user = self.scope["user"]
         if not user.is_authenticated:
-            await self.send(json.dumps({"error": "auth required"}))
+            await self.send_payload({"error": "auth required"})
+            return
+        if data.get("type") == "read":
+            await self.receive_read(user, data, material_id=self.material_id)
             return
 
         # save message to DB
-        await database_sync_to_async(ClassChatMessage.objects.create)(
+        await ensure_fresh_connection()
+        msg = await ClassChatMessage.objects.acreate(
             material_id=self.material_id, sender=user, content=message
         )
+        await amark_write(user.id)
 
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                "type": "chat.message",
-                "message": message,
-                "sender": user.username,
-                "sender_id": user.id,
-            },
+            framing.make_event(
+                "chat.message",
+                {
+                    "id": msg.id,
+                    "message": message,
+                    "sender": user.username,
+                    "sender_id": user.id,
+                },
+            ),
         )
 
     async def chat_message(self, event):
-        # forward to WebSocket
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "message": event["message"],
-                    "sender": event["sender"],
-                    "sender_id": event["sender_id"],
-                }
-            )
-        )
+        # forward to WebSocket, frame is encoded once per event
+        await self.send_event(event)
 
 
-class DirectChatConsumer(AsyncWebsocketConsumer):
+class DirectChatConsumer(FramedConsumer):
     async def connect(self):
         # url contains other_user_id
         self.other_user_id = self.scope["url_route"]["kwargs"]["other_user_id"]
+        self.recipient = None
         me = (
             str(self.scope["user"].id)
             if self.scope["user"].is_authenticated
             else "anon"
         )
-        # canonical room: smallerid_biggerid
-        ids = sorted([me, str(self.other_user_id)])
-        self.room_group_name = f"direct_{ids[0]}_{ids[1]}"
+        self.room_group_name = direct_group(me, self.other_user_id)
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
+        await self.accept_framed()
+
+        limit = history_limit(self.scope)
+        if limit and self.scope["user"].is_authenticated:
+            await ensure_fresh_connection()
+            user_id = self.scope["user"].id
+            with reads_from_replica(await areplica_allowed(user_id)):
+                await self.send_history(limit)
 
     async def disconnect(self, code):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await ensure_fresh_connection(force=True)
+
+    async def send_history(self, limit):
+        me = self.scope["user"].id
+        qs = (
+            DirectChatMessage.objects.filter(
+                Q(sender_id=me, recipient_id=self.other_user_id)
+                | Q(sender_id=self.other_user_id, recipient_id=me)
+            )
+            .select_related("sender")
+            .order_by("-timestamp")[:limit]
+        )
+        messages = [direct_message_payload(msg) async for msg in qs]
+        messages.reverse()
+        await self.send_payload({"history": messages})
+
+    async def get_recipient(self):
+        # recipient never changes for this socket, look it up once
+        if self.recipient is None:
+            self.recipient = await User.objects.aget(id=self.other_user_id)
+        return self.recipient
 
     async def receive(self, text_data=None, bytes_data=None):
-        data = json.loads(text_data)
+        data = self.decode(text_data, bytes_data)
         message = data.get("message")
         user = self.scope["user"]
         if not user.is_authenticated:
-            await self.send(json.dumps({"error": "auth required"}))
+            await self.send_payload({"error": "auth required"})
+            return
+        if data.get("type") == "read":
+            await self.receive_read(user, data, peer_id=self.other_user_id)
             return
 
-        recipient = await database_sync_to_async(User.objects.get)(
-            id=self.other_user_id
-        )
-        await database_sync_to_async(DirectChatMessage.objects.create)(
+        await ensure_fresh_connection()
+        recipient = await self.get_recipient()
+        msg = await DirectChatMessage.objects.acreate(
             sender=user, recipient=recipient, content=message
         )
+        await amark_write(user.id)
 
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                "type": "direct.message",
-                "message": message,
-                "sender": user.username,
-                "sender_id": user.id,
-                "recipient_id": recipient.id,
-            },
+            framing.make_event(
+                "direct.message",
+                {
+                    "id": msg.id,
+                    "message": message,
+                    "sender": user.username,
+                    "sender_id": user.id,
+                    "recipient_id": recipient.id,
+                },
+            ),
         )
 
     async def direct_message(self, event):
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "message": event["message"],
-                    "sender": event["sender"],
-                    "sender_id": event["sender_id"],
-                    "recipient_id": event["recipient_id"],
-                }
-            )
-        )
+        await self.send_event(event)
+
+
+class NotificationConsumer(FramedConsumer):
+    async def connect(self):
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close()
+            return
+        await ensure_fresh_connection()
+        membership = await aget_membership(self.scope)
+        # classroom-wide notifications go to the student groups; channels
+        # discards self.groups on disconnect
+        self.groups = [user_group(user.id)] + [
+            students_group(classroom_id)
+            for classroom_id in membership.member_ids - membership.taught
+        ]
+        for group in self.groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+        await self.accept_framed()
+
+    async def notification_message(self, event):
+        await self.send_event(event)
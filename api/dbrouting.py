@@ -0,0 +1,76 @@
+"""
+Read-replica routing with read-your-writes stickiness.
+
+Reads go to a replica only inside ``reads_from_replica()`` (safe DRF requests
+and websocket history reads). After a user writes, their reads stay on the
+primary for REPLICA_STICKY_SECONDS so they always see their own write.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+
+_use_replica = ContextVar("use_replica", default=False)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith("replica")]
+
+
+def sticky_key(user_id):
+    return f"db-sticky:{user_id}"
+
+
+def mark_write(user_id):
+    cache.set(sticky_key(user_id), 1, settings.REPLICA_STICKY_SECONDS)
+
+
+async def amark_write(user_id):
+    await cache.aset(sticky_key(user_id), 1, settings.REPLICA_STICKY_SECONDS)
+
+
+def replica_allowed(user_id):
+    return bool(replica_aliases()) and not cache.get(sticky_key(user_id))
+
+
+async def areplica_allowed(user_id):
+    return bool(replica_aliases()) and not await cache.aget(sticky_key(user_id))
+
+
+def route_reads_to_replica(enabled=True):
+    """Start routing reads of the current context, returns a reset token."""
+    return _use_replica.set(enabled)
+
+
+def reset_read_routing(token):
+    _use_replica.reset(token)
+
+
+@contextmanager
+def reads_from_replica(enabled=True):
+    token = route_reads_to_replica(enabled)
+    try:
+        yield
+    finally:
+        reset_read_routing(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            aliases = replica_aliases()
+            if aliases:
+                return random.choice(aliases)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas mirror the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
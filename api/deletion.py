@@ -0,0 +1,143 @@
+"""
+Soft delete and background purge for classrooms and users.
+
+Deleting only sets ``deleted_at`` (the default managers hide those rows),
+writes the sync tombstones and queues a purge task. The purge removes the
+dependent rows leaf-first in primary-key ranges of ``BATCH_SIZE`` with
+``_raw_delete``, so nothing is loaded into memory and every lock is short.
+Submission files are deleted by a separate task after their rows are gone;
+archived chat files (api/archive.py) of the purged materials and of the
+user's direct threads go with their ``ChatArchive`` rows.
+"""
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .archive import delete_archives, user_threads
+from .models import (
+    ChangeLog,
+    ChatArchive,
+    ChatReadMarker,
+    ClassChatMessage,
+    Classroom,
+    DirectChatMessage,
+    Enrollment,
+    Material,
+    Notification,
+    ProvisionJob,
+    Submission,
+    User,
+)
+from .sync import record_many
+from .taskqueue import enqueue
+
+BATCH_SIZE = 1000
+FILES_PER_TASK = 200
+
+
+def delete_classroom(classroom):
+    with transaction.atomic():
+        Classroom.all_objects.filter(pk=classroom.pk).update(deleted_at=timezone.now())
+        # bulk deletes send no signals: every student leaves, the teacher
+        # gets the classroom tombstone
+        entries = [
+            ("enrollment", pk, classroom.pk, ChangeLog.DELETE, user_id)
+            for pk, user_id in Enrollment.objects.filter(
+                classroom=classroom
+            ).values_list("pk", "user_id")
+        ]
+        entries.append(
+            (
+                "classroom",
+                classroom.pk,
+                classroom.pk,
+                ChangeLog.DELETE,
+                classroom.teacher_id,
+            )
+        )
+        record_many(entries)
+        enqueue(
+            "deletion.purge_classroom",
+            {"classroom_id": str(classroom.pk)},
+            key=f"purge_classroom:{classroom.pk}",
+        )
+
+
+def delete_user(user):
+    with transaction.atomic():
+        User.all_objects.filter(pk=user.pk).update(
+            deleted_at=timezone.now(), is_active=False
+        )
+        for classroom in Classroom.objects.filter(teacher=user):
+            delete_classroom(classroom)
+        record_many(
+            ("submission", pk, classroom_id, ChangeLog.DELETE, user.pk)
+            for pk, classroom_id in Submission.objects.filter(student=user).values_list(
+                "pk", "material__classroom_id"
+            )
+        )
+        enqueue(
+            "deletion.purge_user", {"user_id": user.pk}, key=f"purge_user:{user.pk}"
+        )
+
+
+def delete_in_batches(qs, file_field=None):
+    """
+    Delete the rows of ``qs`` in pk order, BATCH_SIZE per transaction,
+    without the cascade collector. Returns the number of rows deleted.
+    """
+    qs = qs.order_by("pk")
+    fields = ["pk", file_field] if file_field else ["pk"]
+    deleted = 0
+    while batch := list(qs.values_list(*fields)[:BATCH_SIZE]):
+        with transaction.atomic(using=qs.db):
+            if file_field:
+                delete_files([row[1] for row in batch if row[1]])
+            deleted += qs.filter(pk__lte=batch[-1][0])._raw_delete(qs.db)
+    return deleted
+
+
+def delete_files(names):
+    # runs after the rows are committed
+    for start in range(0, len(names), FILES_PER_TASK):
+        enqueue(
+            "deletion.delete_files", {"names": names[start : start + FILES_PER_TASK]}
+        )
+
+
+def purge_classroom(classroom_id):
+    in_classroom = Q(material__classroom_id=classroom_id)
+    material_ids = Material.objects.filter(classroom_id=classroom_id).values_list(
+        "pk", flat=True
+    )
+    delete_archives(ChatArchive.CLASS, Q(thread__in=[str(pk) for pk in material_ids]))
+    delete_in_batches(ClassChatMessage.objects.filter(in_classroom))
+    delete_in_batches(ChatReadMarker.objects.filter(in_classroom))
+    delete_in_batches(Submission.objects.filter(in_classroom), "file")
+    delete_in_batches(Material.objects.filter(classroom_id=classroom_id))
+    delete_in_batches(Enrollment.objects.filter(classroom_id=classroom_id))
+    ProvisionJob.objects.filter(classroom_id=classroom_id).delete()
+    # only the row itself is left, tombstones were logged on soft delete
+    qs = Classroom.all_objects.filter(pk=classroom_id)
+    qs._raw_delete(qs.db)
+
+
+def purge_user(user_id):
+    for classroom_id in Classroom.all_objects.filter(teacher_id=user_id).values_list(
+        "pk", flat=True
+    ):
+        purge_classroom(classroom_id)
+    delete_in_batches(ClassChatMessage.objects.filter(sender_id=user_id))
+    delete_in_batches(
+        DirectChatMessage.objects.filter(Q(sender_id=user_id) | Q(recipient_id=user_id))
+    )
+    delete_archives(ChatArchive.DIRECT, user_threads(user_id))
+    delete_in_batches(
+        ChatReadMarker.objects.filter(Q(user_id=user_id) | Q(peer_id=user_id))
+    )
+    delete_in_batches(Notification.objects.filter(user_id=user_id))
+    delete_in_batches(Submission.objects.filter(student_id=user_id), "file")
+    delete_in_batches(Enrollment.objects.filter(user_id=user_id))
+    ProvisionJob.objects.filter(requested_by_id=user_id).delete()
+    # groups, permissions, admin log: small, let the collector handle them
+    User.all_objects.filter(pk=user_id).delete()
@@ -0,0 +1,118 @@
+"""
+Websocket frame encoding for the chat consumers.
+
+Clients pick an encoding with the websocket subprotocol:
+
+- no subprotocol / ``kelasmu.json.v1``: JSON text, full key names (default)
+- ``kelasmu.compact.v1``: JSON text, short key names
+- ``kelasmu.msgpack.v1``: msgpack binary, short key names (needs ``msgpack``)
+
+A channel-layer event carries one canonical frame, the payload as default
+JSON, encoded once by the sender before ``group_send``. Sockets on the
+default encoding forward it as is; the other encodings are made once per
+process and event (``encode_frame``) and shared by the local sockets using it.
+"""
+
+import functools
+import json
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+JSON = "kelasmu.json.v1"
+COMPACT = "kelasmu.compact.v1"
+MSGPACK = "kelasmu.msgpack.v1"
+
+SHORT_KEYS = {
+    "id": "i",
+    "message": "m",
+    "sender": "s",
+    "sender_id": "si",
+    "recipient_id": "ri",
+    "history": "h",
+    "error": "e",
+    "type": "t",
+    "last_read_id": "lr",
+}
+LONG_KEYS = {v: k for k, v in SHORT_KEYS.items()}
+# recent (frame, encoding) pairs; one event reaches all local sockets in a burst
+FRAME_CACHE_SIZE = 256
+
+
+def supported_subprotocols():
+    protocols = [JSON, COMPACT]
+    if msgpack is not None:
+        protocols.append(MSGPACK)
+    return protocols
+
+
+def negotiate(requested):
+    """Pick the first subprotocol offered by the client that we support."""
+    supported = supported_subprotocols()
+    for protocol in requested or ():
+        if protocol in supported:
+            return protocol
+    return None
+
+
+def shorten(value):
+    if isinstance(value, dict):
+        return {SHORT_KEYS.get(k, k): shorten(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [shorten(v) for v in value]
+    return value
+
+
+def lengthen(value):
+    if isinstance(value, dict):
+        return {LONG_KEYS.get(k, k): v for k, v in value.items()}
+    return value
+
+
+def dumps(payload):
+    return json.dumps(payload, separators=(",", ":"))
+
+
+def encode(payload, protocol):
+    """Return (text_data, bytes_data) for a payload in the given encoding."""
+    if protocol == MSGPACK:
+        return None, msgpack.packb(shorten(payload))
+    if protocol == COMPACT:
+        return dumps(shorten(payload)), None
+    return dumps(payload), None
+
+
+def event_payload(event):
+    return json.loads(event["text"])
+
+
+def encode_event(event, protocol):
+    """Return (text_data, bytes_data) for an event built by make_event."""
+    if protocol in (None, JSON):
+        return event["text"], None
+    return encode_frame(event["text"], protocol)
+
+
+@functools.lru_cache(maxsize=FRAME_CACHE_SIZE)
+def encode_frame(text, protocol):
+    return encode(json.loads(text), protocol)
+
+
+def decode(text_data, bytes_data, protocol):
+    """Decode an incoming frame into a dict with full key names."""
+    if bytes_data is not None:
+        if protocol != MSGPACK:
+            raise ValueError("binary frames need the msgpack subprotocol")
+        data = msgpack.unpackb(bytes_data)
+    else:
+        data = json.loads(text_data)
+    if protocol in (COMPACT, MSGPACK):
+        data = lengthen(data)
+    return data
+
+
+def make_event(event_type, payload):
+    """Build a channel-layer event carrying the payload as its default frame."""
+    return {"type": event_type, "text": dumps(payload)}
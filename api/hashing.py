@@ -0,0 +1,42 @@
+"""
+Password hashing in worker processes, for bulk account creation.
+
+PBKDF2 is ~100ms of CPU per password and holds the GIL, so threads don't
+help. Workers are spawned (forking a threaded server is unsafe) and only set
+up Django, this module imports nothing from the app at load time.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# below this many passwords starting the pool costs more than it saves
+POOL_THRESHOLD = 32
+
+
+def init_worker(settings_module):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    import django
+
+    django.setup()
+
+
+def make_password(password):
+    from django.contrib.auth.hashers import make_password
+
+    return make_password(password)
+
+
+def hash_passwords(passwords, workers=None, chunksize=16):
+    """Yield the hashes of ``passwords`` in order, computed on all cores."""
+    passwords = list(passwords)
+    if len(passwords) < POOL_THRESHOLD or workers == 1:
+        yield from map(make_password, passwords)
+        return
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(os.environ["DJANGO_SETTINGS_MODULE"],),
+    ) as pool:
+        yield from pool.map(make_password, passwords, chunksize=chunksize)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api import thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        "Mark image submissions whose thumbnails already exist as ready and "
+        "queue generation for the others (files uploaded before thumbnails_ready)"
+    )
+
+    def handle(self, *args, **options):
+        ready, queued = thumbnails.backfill()
+        self.stdout.write(f"{ready} ready, {queued} queued")
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from channels.db import database_sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from api.consumers import ensure_fresh_connection
+from api.models import Classroom, Material, ClassChatMessage
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Compare chat write/read throughput: database_sync_to_async vs async ORM"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=20)
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username="bench_chat_user")
+        classroom = Classroom.objects.create(teacher=user, title="bench chat")
+        material = Material.objects.create(classroom=classroom, title="bench chat")
+        try:
+            for name, write, read in (
+                ("database_sync_to_async", self.sync_write, self.sync_read),
+                ("async orm", self.async_write, self.async_read),
+            ):
+                elapsed = asyncio.run(
+                    self.run(
+                        write,
+                        material,
+                        user,
+                        options["messages"],
+                        options["concurrency"],
+                    )
+                )
+                self.report(name, "write", options["messages"], elapsed)
+                elapsed = asyncio.run(
+                    self.run_reads(read, material, options["concurrency"])
+                )
+                self.report(name, "read", options["concurrency"], elapsed)
+                ClassChatMessage.objects.filter(material=material).delete()
+        finally:
+            classroom.delete()
+
+    def report(self, name, op, count, elapsed):
+        self.stdout.write(
+            f"{name:>24} {op:<5} {count:>6} ops in {elapsed:.3f}s "
+            f"({count / elapsed:.0f} ops/s)"
+        )
+
+    async def run(self, write, material, user, total, concurrency):
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            async with sem:
+                await write(material, user, f"message {i}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        return time.perf_counter() - start
+
+    async def run_reads(self, read, material, concurrency):
+        start = time.perf_counter()
+        await asyncio.gather(*(read(material) for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+    async def sync_write(self, material, user, content):
+        await database_sync_to_async(ClassChatMessage.objects.create)(
+            material_id=material.id, sender=user, content=content
+        )
+
+    async def async_write(self, material, user, content):
+        await ensure_fresh_connection()
+        await ClassChatMessage.objects.acreate(
+            material_id=material.id, sender=user, content=content
+        )
+
+    async def sync_read(self, material):
+        qs = ClassChatMessage.objects.filter(material=material).select_related("sender")
+        return await database_sync_to_async(list)(qs[:100])
+
+    async def async_read(self, material):
+        await ensure_fresh_connection()
+        qs = ClassChatMessage.objects.filter(material=material).select_related("sender")
+        return [msg async for msg in qs[:100]]
@@ -0,0 +1,40 @@
+import asyncio
+import time
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Measure group_send fan-out to a large room on the configured channel layer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=500)
+        parser.add_argument("--messages", type=int, default=20)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"layer: {settings.CHANNEL_LAYERS['default']['BACKEND']}")
+        elapsed = asyncio.run(self.run(options["members"], options["messages"]))
+        deliveries = options["members"] * options["messages"]
+        self.stdout.write(
+            f"{options['messages']} messages to {options['members']} members: "
+            f"{elapsed:.3f}s ({deliveries / elapsed:.0f} deliveries/s)"
+        )
+
+    async def run(self, members, messages):
+        layer = get_channel_layer()
+        group = "material_bench_fanout"
+        channels = [await layer.new_channel() for _ in range(members)]
+        for channel in channels:
+            await layer.group_add(group, channel)
+        try:
+            start = time.perf_counter()
+            for i in range(messages):
+                await layer.group_send(group, {"type": "chat.message", "message": i})
+                # every member must see the message before the next one goes out
+                received = await asyncio.gather(*(layer.receive(c) for c in channels))
+                assert all(msg["message"] == i for msg in received)
+            return time.perf_counter() - start
+        finally:
+            for channel in channels:
+                await layer.group_discard(group, channel)
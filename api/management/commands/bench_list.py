@@ -0,0 +1,75 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from api.models import Classroom, Material, ClassChatMessage, Submission
+from api.renderers import ORJSONRenderer
+from api.rowmappers import CLASS_CHAT_MAPPER, SUBMISSION_MAPPER
+from api.serializers import ClassChatMessageSerializer, SubmissionSerializer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Compare serializer vs RowMapper list rendering on large pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        teacher, _ = User.objects.get_or_create(
+            username="bench_list_teacher", defaults={"is_teacher": True}
+        )
+        student, _ = User.objects.get_or_create(username="bench_list_student")
+        classroom = Classroom.objects.create(teacher=teacher, title="bench list")
+        material = Material.objects.create(classroom=classroom, title="bench list")
+        ClassChatMessage.objects.bulk_create(
+            ClassChatMessage(material=material, sender=student, content=f"msg {i}")
+            for i in range(rows)
+        )
+        Submission.objects.bulk_create(
+            Submission(material=material, student=student, file=f"submissions/{i}.pdf")
+            for i in range(rows)
+        )
+        request = Request(APIRequestFactory().get("/api/"))
+        try:
+            chat = ClassChatMessage.objects.filter(material=material).order_by(
+                "timestamp"
+            )
+            submissions = Submission.objects.filter(material=material)
+            for name, qs, serializer_class, mapper in (
+                ("class-chat", chat, ClassChatMessageSerializer, CLASS_CHAT_MAPPER),
+                ("submissions", submissions, SubmissionSerializer, SUBMISSION_MAPPER),
+            ):
+                slow = self.best(
+                    options["repeat"],
+                    lambda: JSONRenderer().render(
+                        serializer_class(
+                            qs.select_related(serializer_class.expandable_fields[0]),
+                            many=True,
+                            context={"request": request},
+                        ).data
+                    ),
+                )
+                fast = self.best(
+                    options["repeat"],
+                    lambda: ORJSONRenderer().render(mapper.rows(qs, request)),
+                )
+                self.stdout.write(
+                    f"{name:>12} {rows} rows: serializer {slow:.3f}s, "
+                    f"rowmapper+orjson {fast:.3f}s ({slow / fast:.1f}x)"
+                )
+        finally:
+            classroom.delete()
+
+    def best(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Create upcoming monthly chat partitions and archive months older than "
+        "the retention window to compressed JSONL files"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead", type=int, default=3, help="months of partitions to create ahead"
+        )
+        parser.add_argument(
+            "--retention",
+            type=int,
+            default=settings.CHAT_RETENTION_MONTHS,
+            help="months to keep in the database (0 disables archiving)",
+        )
+
+    def handle(self, *args, **options):
+        for name in archive.ensure_partitions(options["ahead"]):
+            self.stdout.write(f"created partition {name}")
+
+        if options["retention"] <= 0:
+            return
+        cutoff = archive.add_months(
+            archive.month_start(timezone.now()), -options["retention"]
+        )
+        for kind, month, rows in archive.archive_before(cutoff):
+            self.stdout.write(f"archived {kind} chat {month:%Y-%m}: {rows} rows")
@@ -0,0 +1,37 @@
+import csv
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Classroom
+from api.provisioning import CHUNK_SIZE, clean_rows, provision
+
+
+class Command(BaseCommand):
+    help = "Create student accounts from a CSV file (username,password,email)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_file")
+        parser.add_argument("--classroom", help="enroll the students into this class")
+        parser.add_argument(
+            "--workers", type=int, default=None, help="hashing processes (all cores)"
+        )
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        classroom = None
+        if options["classroom"]:
+            try:
+                classroom = Classroom.objects.get(pk=options["classroom"])
+            except Classroom.DoesNotExist:
+                raise CommandError(f"classroom {options['classroom']} not found")
+        with open(options["csv_file"], newline="", encoding="utf-8-sig") as f:
+            students, errors = clean_rows(csv.DictReader(f))
+        if errors:
+            for error in errors:
+                self.stderr.write(f"row {error['row']}: {error['detail']}")
+            raise CommandError("no accounts created")
+
+        for step in provision(
+            students, classroom, options["workers"], options["chunk_size"]
+        ):
+            for error in step["errors"]:
+                self.stderr.write(f"row {error['row']}: {error['detail']}")
+            self.stdout.write(f"created {step['created']}/{step['total']}")
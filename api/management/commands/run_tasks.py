@@ -0,0 +1,36 @@
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api import taskqueue
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=10)
+        parser.add_argument(
+            "--sleep", type=float, default=1.0, help="seconds to wait when idle"
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="run due tasks then exit"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # daily cleanup of finished tasks, the key makes it once per day
+            taskqueue.enqueue(
+                "tasks.purge_finished", key=f"purge:{timezone.now():%Y-%m-%d}"
+            )
+            # hourly: bulk provisioning rows (passwords) nobody ran
+            taskqueue.enqueue(
+                "provisioning.expire",
+                key=f"provision_expire:{timezone.now():%Y-%m-%d-%H}",
+            )
+            ran = taskqueue.run_pending(options["batch"])
+            if ran:
+                self.stdout.write(f"ran {ran} task(s)")
+                continue
+            if options["once"]:
+                return
+            time.sleep(options["sleep"])
@@ -0,0 +1,73 @@
+"""
+Classroom membership for permission checks.
+
+The classrooms a user teaches or is enrolled in are loaded with one query
+and memoized on the request (``get_membership``) or on the websocket scope
+(``aget_membership``), so object checks and queryset filters don't query
+again however many objects are involved. A socket keeps the membership it
+had when it connected.
+"""
+
+from django.db.models import Q
+from .models import Classroom
+
+
+class Membership:
+    def __init__(self, user_id=None, taught=(), enrolled=()):
+        self.user_id = user_id
+        # ids as strings, so url/query values compare equal to UUIDs
+        self.taught = frozenset(map(str, taught))
+        self.member_ids = self.taught | frozenset(map(str, enrolled))
+
+    def teaches(self, classroom_id):
+        return str(classroom_id) in self.taught
+
+    def is_member(self, classroom_id):
+        return str(classroom_id) in self.member_ids
+
+
+def membership_query(user):
+    return (
+        Classroom.objects.filter(Q(teacher=user) | Q(enrollments__user=user))
+        .values_list("id", "teacher_id")
+        .distinct()
+    )
+
+
+def build(user, rows):
+    taught = [cid for cid, teacher_id in rows if teacher_id == user.id]
+    enrolled = [cid for cid, teacher_id in rows if teacher_id != user.id]
+    return Membership(user.id, taught, enrolled)
+
+
+def load(user):
+    if not user.is_authenticated:
+        return Membership()
+    return build(user, list(membership_query(user)))
+
+
+async def aload(user):
+    if not user.is_authenticated:
+        return Membership()
+    return build(user, [row async for row in membership_query(user)])
+
+
+def get_membership(request):
+    membership = getattr(request, "_membership", None)
+    if membership is None:
+        membership = request._membership = load(request.user)
+    return membership
+
+
+async def aget_membership(scope):
+    if "membership" not in scope:
+        scope["membership"] = await aload(scope["user"])
+    return scope["membership"]
+
+
+def classroom_id_of(obj):
+    if isinstance(obj, Classroom):
+        return obj.id
+    if hasattr(obj, "classroom_id"):
+        return obj.classroom_id
+    return obj.material.classroom_id
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_alter_classroom_join_token"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChatArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("class", "Class chat"), ("direct", "Direct chat")],
+                        max_length=10,
+                    ),
+                ),
+                ("month", models.DateField()),
+                ("thread", models.CharField(max_length=64)),
+                ("path", models.CharField(max_length=500)),
+                ("row_count", models.PositiveIntegerField(default=0)),
+                ("first_id", models.BigIntegerField()),
+                ("last_id", models.BigIntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["kind", "thread", "month"],
+                        name="api_chatarc_kind_37ebf1_idx",
+                    )
+                ],
+            },
+        ),
+    ]
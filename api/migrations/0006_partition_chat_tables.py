@@ -0,0 +1,88 @@
+from django.db import migrations
+
+# (table, [(fk column, referenced table)])
+CHAT_TABLES = [
+    (
+        "api_classchatmessage",
+        [("material_id", "api_material"), ("sender_id", "api_user")],
+    ),
+    (
+        "api_directchatmessage",
+        [("sender_id", "api_user"), ("recipient_id", "api_user")],
+    ),
+]
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def partition_table(cursor, table, fks):
+    legacy = f"{table}_legacy"
+    cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+    # free the names the new table takes, the old one only gets read from now
+    cursor.execute(
+        f'ALTER TABLE "{legacy}" RENAME CONSTRAINT "{table}_pkey" TO "{legacy}_pkey"'
+    )
+    cursor.execute(f'ALTER TABLE "{legacy}" ALTER COLUMN "id" DROP IDENTITY IF EXISTS')
+    cursor.execute(
+        f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) '
+        f'PARTITION BY RANGE ("timestamp")'
+    )
+    cursor.execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+
+    # one partition per month of existing data, plus the next few months
+    cursor.execute(
+        "SELECT date_trunc('month', COALESCE(MIN(\"timestamp\"), now())), "
+        f"date_trunc('month', now()) FROM \"{legacy}\""
+    )
+    month, current = cursor.fetchone()
+    last = add_months(current, 3)
+    while month <= last:
+        cursor.execute(
+            f'CREATE TABLE "{table}_p{month:%Y_%m}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM (%s) TO (%s)",
+            [month, add_months(month, 1)],
+        )
+        month = add_months(month, 1)
+
+    # existing rows are copied in batches by 0014_backfill_chat_partitions
+    cursor.execute(f'CREATE SEQUENCE "{table}_id_seq" OWNED BY "{table}"."id"')
+    cursor.execute(
+        f"SELECT setval('\"{table}_id_seq\"', COALESCE(MAX(id), 0) + 1, false) "
+        f'FROM "{legacy}"'
+    )
+    cursor.execute(
+        f'ALTER TABLE "{table}" ALTER COLUMN "id" '
+        f"SET DEFAULT nextval('\"{table}_id_seq\"')"
+    )
+    # the partition key has to be part of the primary key
+    cursor.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY ("id", "timestamp")')
+    for column, ref in fks:
+        cursor.execute(
+            f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_{column}_fk" '
+            f'FOREIGN KEY ("{column}") REFERENCES "{ref}" ("id") '
+            f"DEFERRABLE INITIALLY DEFERRED"
+        )
+        cursor.execute(f'CREATE INDEX "{table}_{column}_idx" ON "{table}" ("{column}")')
+
+
+def partition_chat_tables(apps, schema_editor):
+    # declarative partitioning is postgres only, other databases keep plain tables
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table, fks in CHAT_TABLES:
+            partition_table(cursor, table, fks)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_chatarchive"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_chat_tables, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_notification"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChatReadMarker",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("last_read_id", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="classchatmessage",
+            index=models.Index(
+                fields=["material", "id"], name="api_classch_materia_427e09_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="directchatmessage",
+            index=models.Index(
+                fields=["recipient", "sender", "id"],
+                name="api_directc_recipie_8068b6_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="chatreadmarker",
+            name="material",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="api.material",
+            ),
+        ),
+        migrations.AddField(
+            model_name="chatreadmarker",
+            name="peer",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name="chatreadmarker",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="chat_read_markers",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="chatreadmarker",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("material__isnull", False)),
+                fields=("user", "material"),
+                name="unique_material_read_marker",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="chatreadmarker",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("peer__isnull", False)),
+                fields=("user", "peer"),
+                name="unique_direct_read_marker",
+            ),
+        ),
+    ]
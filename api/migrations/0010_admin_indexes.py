@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_chat_read_markers"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="classchatmessage",
+            index=models.Index(
+                fields=["timestamp"], name="api_classch_timesta_e9b468_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="directchatmessage",
+            index=models.Index(
+                fields=["timestamp"], name="api_directc_timesta_be8a0e_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="submission",
+            index=models.Index(
+                fields=["-created_at"], name="api_submiss_created_665d90_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="submission",
+            index=models.Index(
+                fields=["graded", "-created_at"], name="api_submiss_graded_8b37f3_idx"
+            ),
+        ),
+    ]
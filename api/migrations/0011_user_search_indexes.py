@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:19
+
+from django.db import migrations, models
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # trigram GIN indexes back the substring user search on postgres
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for column in ("username", "email"):
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS api_user_{column}_trgm "
+            f"ON api_user USING gin ({column} gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for column in ("username", "email"):
+        schema_editor.execute(f"DROP INDEX IF EXISTS api_user_{column}_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_admin_indexes"),
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(fields=["email"], name="api_user_email_a7eefd_idx"),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:20
+
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    # existing rows become the initial upserts so since=0 returns everything
+    ChangeLog = apps.get_model("api", "ChangeLog")
+    Classroom = apps.get_model("api", "Classroom")
+    Material = apps.get_model("api", "Material")
+    Submission = apps.get_model("api", "Submission")
+    rows = [
+        ("classroom", str(pk), pk, None)
+        for pk in Classroom.objects.values_list("id", flat=True).iterator()
+    ]
+    rows += [
+        ("material", str(pk), classroom_id, None)
+        for pk, classroom_id in Material.objects.values_list(
+            "id", "classroom_id"
+        ).iterator()
+    ]
+    rows += [
+        ("submission", str(pk), classroom_id, student_id)
+        for pk, classroom_id, student_id in Submission.objects.values_list(
+            "id", "material__classroom_id", "student_id"
+        ).iterator()
+    ]
+    ChangeLog.objects.bulk_create(
+        (
+            ChangeLog(
+                model=model,
+                object_id=object_id,
+                classroom_id=classroom_id,
+                op="upsert",
+                user_id=user_id,
+            )
+            for model, object_id, classroom_id, user_id in rows
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_user_search_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeLog",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("classroom_id", models.UUIDField()),
+                ("model", models.CharField(max_length=20)),
+                ("object_id", models.CharField(max_length=64)),
+                (
+                    "op",
+                    models.CharField(
+                        choices=[("upsert", "Upsert"), ("delete", "Delete")],
+                        max_length=10,
+                    ),
+                ),
+                ("user_id", models.BigIntegerField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["classroom_id", "id"],
+                        name="api_changel_classro_0374eb_idx",
+                    ),
+                    models.Index(
+                        fields=["user_id", "id"], name="api_changel_user_id_772247_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
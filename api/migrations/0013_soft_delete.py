@@ -0,0 +1,110 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:32
+
+import api.models
+import django.contrib.auth.models
+from django.db import migrations, models
+
+# foreign keys the database may cascade itself: nothing else (files, signals)
+# depends on these rows. Submissions are left out, their files are deleted
+# by the purge task (api/deletion.py) before the rows go.
+CASCADE_FKS = [
+    ("api_material", "classroom_id", "api_classroom"),
+    ("api_enrollment", "classroom_id", "api_classroom"),
+    ("api_enrollment", "user_id", "api_user"),
+    ("api_classchatmessage", "material_id", "api_material"),
+    ("api_classchatmessage", "sender_id", "api_user"),
+    ("api_directchatmessage", "sender_id", "api_user"),
+    ("api_directchatmessage", "recipient_id", "api_user"),
+    ("api_chatreadmarker", "user_id", "api_user"),
+    ("api_chatreadmarker", "material_id", "api_material"),
+    ("api_chatreadmarker", "peer_id", "api_user"),
+    ("api_notification", "user_id", "api_user"),
+]
+
+
+def fk_names(cursor, table, column):
+    # the table's own constraints, not the ones a partition inherits
+    cursor.execute(
+        "SELECT c.conname FROM pg_constraint c "
+        "JOIN pg_attribute a ON a.attrelid = c.conrelid "
+        "AND a.attnum = ANY (c.conkey) "
+        "WHERE c.contype = 'f' AND c.conrelid = %s::regclass "
+        "AND a.attname = %s AND c.conparentid = 0",
+        [table, column],
+    )
+    return [name for (name,) in cursor.fetchall()]
+
+
+def leaf_partitions(cursor, table):
+    cursor.execute(
+        "SELECT relid::regclass::text FROM pg_partition_tree(%s::regclass) "
+        "WHERE isleaf AND level > 0",
+        [table],
+    )
+    return [part for (part,) in cursor.fetchall()]
+
+
+def replace_fks(schema_editor, on_delete):
+    # added NOT VALID, so only a brief lock: the existing rows are checked by
+    # 0018 with VALIDATE CONSTRAINT, which doesn't block writes
+    with schema_editor.connection.cursor() as cursor:
+        for table, column, ref in CASCADE_FKS:
+            names = fk_names(cursor, table, column)
+            for name in names:
+                cursor.execute(f'ALTER TABLE "{table}" DROP CONSTRAINT "{name}"')
+            # a partitioned table can't take NOT VALID: the constraint goes on
+            # each partition and 0018 adds it to the parent once they are valid
+            partitions = leaf_partitions(cursor, table)
+            for part in partitions:
+                # left there when 0018 hasn't run yet
+                for name in fk_names(cursor, part, column):
+                    cursor.execute(f'ALTER TABLE {part} DROP CONSTRAINT "{name}"')
+                    names.append(name)
+            for name in dict.fromkeys(names):
+                for target in partitions or [f'"{table}"']:
+                    cursor.execute(
+                        f'ALTER TABLE {target} ADD CONSTRAINT "{name}" '
+                        f'FOREIGN KEY ("{column}") REFERENCES "{ref}" ("id") '
+                        f"{on_delete} DEFERRABLE INITIALLY DEFERRED NOT VALID"
+                    )
+
+
+def db_cascade(apps, schema_editor):
+    # rows written while a purge runs are removed with their parent
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    replace_fks(schema_editor, "ON DELETE CASCADE")
+
+
+def no_db_cascade(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    replace_fks(schema_editor, "ON DELETE NO ACTION")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_changelog"),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name="user",
+            managers=[
+                ("objects", api.models.ActiveUserManager()),
+                ("all_objects", django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="classroom",
+            name="deleted_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="deleted_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(db_cascade, no_db_cascade),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations, transaction
+
+TABLES = ["api_classchatmessage", "api_directchatmessage"]
+BATCH_SIZE = 10000
+
+
+def backfill(apps, schema_editor):
+    """
+    Move the rows 0006 left in ``<table>_legacy`` into the partitioned table,
+    one committed batch at a time, then drop the old table. Moved rows are
+    deleted from it, so an interrupted run continues where it stopped.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    for table in TABLES:
+        legacy = f"{table}_legacy"
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", [legacy])
+            if cursor.fetchone()[0] is None:
+                continue
+            while True:
+                with transaction.atomic(using=connection.alias):
+                    cursor.execute(
+                        f'WITH moved AS (DELETE FROM "{legacy}" WHERE "id" IN '
+                        f'(SELECT "id" FROM "{legacy}" ORDER BY "id" LIMIT %s) '
+                        f"RETURNING *) "
+                        f'INSERT INTO "{table}" SELECT * FROM moved',
+                        [BATCH_SIZE],
+                    )
+                    if cursor.rowcount < BATCH_SIZE:
+                        break
+            cursor.execute(f'DROP TABLE "{legacy}"')
+
+
+class Migration(migrations.Migration):
+    # every batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ("api", "0013_soft_delete"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+def create_prefix_indexes(apps, schema_editor):
+    # lower(column) LIKE 'q%' for short, case-insensitive user search on postgres
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for column in ("username", "email"):
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS api_user_{column}_lower_prefix "
+            f"ON api_user (lower({column}) text_pattern_ops)"
+        )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for column in ("username", "email"):
+        schema_editor.execute(f"DROP INDEX IF EXISTS api_user_{column}_lower_prefix")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0014_backfill_chat_partitions"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
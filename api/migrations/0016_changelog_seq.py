@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:55
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def number_existing(apps, schema_editor):
+    # tokens handed out so far are ids, keep them valid
+    ChangeLog = apps.get_model("api", "ChangeLog")
+    ChangeLog.objects.update(seq=F("id"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0015_user_search_lower_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="changelog",
+            name="api_changel_classro_0374eb_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="changelog",
+            name="api_changel_user_id_772247_idx",
+        ),
+        migrations.AddField(
+            model_name="changelog",
+            name="seq",
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.RunPython(number_existing, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="changelog",
+            index=models.Index(
+                fields=["classroom_id", "seq"], name="api_changel_classro_f62074_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="changelog",
+            index=models.Index(
+                fields=["user_id", "seq"], name="api_changel_user_id_f624d6_idx"
+            ),
+        ),
+    ]
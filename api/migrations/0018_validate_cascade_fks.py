@@ -0,0 +1,78 @@
+from django.db import migrations
+
+# the foreign keys 0013 re-added NOT VALID
+CASCADE_FKS = [
+    ("api_material", "classroom_id"),
+    ("api_enrollment", "classroom_id"),
+    ("api_enrollment", "user_id"),
+    ("api_classchatmessage", "material_id"),
+    ("api_classchatmessage", "sender_id"),
+    ("api_directchatmessage", "sender_id"),
+    ("api_directchatmessage", "recipient_id"),
+    ("api_chatreadmarker", "user_id"),
+    ("api_chatreadmarker", "material_id"),
+    ("api_chatreadmarker", "peer_id"),
+    ("api_notification", "user_id"),
+]
+
+
+def fk_constraints(cursor, table, column):
+    # the table's own constraints, not the ones a partition inherits
+    cursor.execute(
+        "SELECT c.conname, c.convalidated, pg_get_constraintdef(c.oid) "
+        "FROM pg_constraint c "
+        "JOIN pg_attribute a ON a.attrelid = c.conrelid "
+        "AND a.attnum = ANY (c.conkey) "
+        "WHERE c.contype = 'f' AND c.conrelid = %s::regclass "
+        "AND a.attname = %s AND c.conparentid = 0",
+        [table, column],
+    )
+    return cursor.fetchall()
+
+
+def validate(apps, schema_editor):
+    """
+    Check the existing rows against the constraints 0013 added. VALIDATE
+    CONSTRAINT only takes a SHARE UPDATE EXCLUSIVE lock, reads and writes go
+    on meanwhile; each statement commits on its own so no lock is held
+    longer than its scan.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        for table, column in CASCADE_FKS:
+            cursor.execute(
+                "SELECT relid::regclass::text FROM pg_partition_tree(%s::regclass) "
+                "WHERE isleaf AND level > 0",
+                [table],
+            )
+            partitions = [part for (part,) in cursor.fetchall()]
+            for target in partitions or [f'"{table}"']:
+                for name, valid, _ in fk_constraints(cursor, target, column):
+                    if not valid:
+                        cursor.execute(
+                            f'ALTER TABLE {target} VALIDATE CONSTRAINT "{name}"'
+                        )
+            if not partitions or fk_constraints(cursor, table, column):
+                continue
+            # the parent adopts the now valid partition constraints instead
+            # of checking the rows again
+            found = fk_constraints(cursor, partitions[0], column)
+            if found:
+                name, _, definition = found[0]
+                cursor.execute(
+                    f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}'
+                )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("api", "0017_provision_job"),
+    ]
+
+    operations = [
+        migrations.RunPython(validate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0018_validate_cascade_fks"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="submission",
+            name="thumbnails_ready",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations
+
+COLUMNS = ("username", "email")
+
+
+def create_expression_indexes(apps, schema_editor):
+    """
+    The search filters on lower(column) (api/search.py). On postgres the
+    trigram indexes of 0011 were on the raw columns, which that expression
+    can't use: rebuild them on lower(column). SQLite gets plain lower(column)
+    indexes for the prefix range.
+    """
+    vendor = schema_editor.connection.vendor
+    for column in COLUMNS:
+        if vendor == "postgresql":
+            schema_editor.execute(f"DROP INDEX IF EXISTS api_user_{column}_trgm")
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS api_user_{column}_lower_trgm "
+                f"ON api_user USING gin (lower({column}) gin_trgm_ops)"
+            )
+        elif vendor == "sqlite":
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS api_user_{column}_lower "
+                f"ON api_user (lower({column}))"
+            )
+
+
+def drop_expression_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for column in COLUMNS:
+        if vendor == "postgresql":
+            schema_editor.execute(f"DROP INDEX IF EXISTS api_user_{column}_lower_trgm")
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS api_user_{column}_trgm "
+                f"ON api_user USING gin ({column} gin_trgm_ops)"
+            )
+        elif vendor == "sqlite":
+            schema_editor.execute(f"DROP INDEX IF EXISTS api_user_{column}_lower")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0019_submission_thumbnails_ready"),
+    ]
+
+    operations = [
+        # lower(email) LIKE 'q%' can't use a plain index on email
+        migrations.RemoveIndex(
+            model_name="user",
+            name="api_user_email_a7eefd_idx",
+        ),
+        migrations.RunPython(create_expression_indexes, drop_expression_indexes),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0020_user_search_expression_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="classchatmessage",
+            index=models.Index(
+                fields=["material", "id", "sender"],
+                name="api_classch_materia_5aef36_idx",
+            ),
+        ),
+        # after the new index exists, the counts are never without one
+        migrations.RemoveIndex(
+            model_name="classchatmessage",
+            name="api_classch_materia_427e09_idx",
+        ),
+    ]
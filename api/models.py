@@ -2,7 +2,8 @@ import uuid
 import secrets
 from django.conf import settings
 from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
+from django.contrib.auth.models import AbstractUser, UserManager
 
 
 def generate_class_token():
@@ -10,9 +11,23 @@ def generate_class_token():
     return secrets.token_urlsafe(6)
 
 
+class ActiveManager(models.Manager):
+    # hides soft-deleted rows until the purge task removes them (api/deletion.py)
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class ActiveUserManager(ActiveManager, UserManager):
+    pass
+
+
 class User(AbstractUser):
     # username, email, password from AbstractUser
     is_teacher = models.BooleanField(default=False)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ActiveUserManager()
+    all_objects = UserManager()
 
     def __str__(self):
         return self.username
@@ -29,6 +44,10 @@ class Classroom(models.Model):
         max_length=10, unique=True, default=generate_class_token
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
 
     def regenerate_token(self):
         self.join_token = generate_class_token()
@@ -77,9 +96,17 @@ class Submission(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     graded = models.BooleanField(default=False)
     grade = models.CharField(max_length=50, blank=True, null=True)
+    # set by the thumbnails.generate task (api/thumbnails.py)
+    thumbnails_ready = models.BooleanField(default=False, editable=False)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # default ordering / admin date hierarchy
+            models.Index(fields=["-created_at"]),
+            # admin "graded" filter
+            models.Index(fields=["graded", "-created_at"]),
+        ]
 
 
 class ClassChatMessage(models.Model):
@@ -91,6 +118,15 @@ class ClassChatMessage(models.Model):
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # unread counts: WHERE material_id = ? AND id > last_read_id
+            # AND sender_id <> ?, answered from the index alone
+            models.Index(fields=["material", "id", "sender"]),
+            # admin date hierarchy
+            models.Index(fields=["timestamp"]),
+        ]
+
 
 class DirectChatMessage(models.Model):
     # user to user
@@ -106,3 +142,178 @@ class DirectChatMessage(models.Model):
     )
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # unread counts: WHERE recipient_id = ? AND sender_id = ? AND id > last_read_id
+            models.Index(fields=["recipient", "sender", "id"]),
+            # admin date hierarchy
+            models.Index(fields=["timestamp"]),
+        ]
+
+
+class ChatReadMarker(models.Model):
+    # last message a user has read in one thread (material chat or DM with peer)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="chat_read_markers",
+    )
+    material = models.ForeignKey(
+        Material, on_delete=models.CASCADE, null=True, blank=True, related_name="+"
+    )
+    peer = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    last_read_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "material"],
+                condition=models.Q(material__isnull=False),
+                name="unique_material_read_marker",
+            ),
+            models.UniqueConstraint(
+                fields=["user", "peer"],
+                condition=models.Q(peer__isnull=False),
+                name="unique_direct_read_marker",
+            ),
+        ]
+
+
+class ChatArchive(models.Model):
+    # one gzipped jsonl file of archived chat rows for a thread and month
+    CLASS = "class"
+    DIRECT = "direct"
+    KIND_CHOICES = ((CLASS, "Class chat"), (DIRECT, "Direct chat"))
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    month = models.DateField()
+    # material id for class chat, "<low user id>_<high user id>" for direct chat
+    thread = models.CharField(max_length=64)
+    path = models.CharField(max_length=500)
+    row_count = models.PositiveIntegerField(default=0)
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["kind", "thread", "month"])]
+
+
+class Task(models.Model):
+    # background job, run by `python manage.py run_tasks`
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # same key enqueued twice -> only one task
+    idempotency_key = models.CharField(
+        max_length=200, unique=True, null=True, blank=True
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_at"])]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class ProvisionJob(models.Model):
+    # POST /api/users/bulk/, run by the provisioning.run task (api/provisioning.py)
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    classroom = models.ForeignKey(
+        Classroom, on_delete=models.CASCADE, null=True, blank=True, related_name="+"
+    )
+    status = models.CharField(
+        max_length=10, choices=Task.STATUS_CHOICES, default=Task.PENDING
+    )
+    # submitted rows (passwords included), emptied when the job starts or expires
+    rows = models.JSONField(default=list, blank=True)
+    total = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # [{"row": n, "detail": "..."}] for rows that were not created
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"provision {self.id} ({self.status})"
+
+
+class Notification(models.Model):
+    MATERIAL_PUBLISHED = "material_published"
+    SUBMISSION_GRADED = "submission_graded"
+    KIND_CHOICES = (
+        (MATERIAL_PUBLISHED, "Material published"),
+        (SUBMISSION_GRADED, "Submission graded"),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="notifications",
+    )
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    title = models.CharField(max_length=255)
+    # ids the client needs to open the target (classroom, material, submission)
+    data = models.JSONField(default=dict, blank=True)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-id"]
+        # unread list: WHERE user_id = ? AND is_read = false ORDER BY id DESC
+        indexes = [models.Index(fields=["user", "is_read", "-id"])]
+
+
+class ChangeLog(models.Model):
+    # append-only; seq (commit order) is handed out as the /api/sync/ token
+    UPSERT = "upsert"
+    DELETE = "delete"
+    OP_CHOICES = ((UPSERT, "Upsert"), (DELETE, "Delete"))
+
+    # not a FK: entries outlive the classroom (tombstones)
+    classroom_id = models.UUIDField()
+    model = models.CharField(max_length=20)
+    object_id = models.CharField(max_length=64)
+    op = models.CharField(max_length=10, choices=OP_CHOICES)
+    # set for private entries: the submission's student, the enrolled user,
+    # the teacher of a deleted classroom
+    user_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # numbered after the writing transaction commits (api/sync.py)
+    seq = models.BigIntegerField(null=True, blank=True, unique=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["classroom_id", "seq"]),
+            models.Index(fields=["user_id", "seq"]),
+        ]
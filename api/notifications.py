@@ -0,0 +1,101 @@
+"""
+Notification fan-out.
+
+Rows are written with bulk_create in chunks, the push happens after commit.
+A notification for a whole classroom (new material) is pushed once to the
+classroom's ``students_<id>`` group, which every student's
+NotificationConsumer joins on connect, so the channel layer gets one write
+however many students there are. That push has no per-user ``id``; clients
+get ids from ``GET /api/notifications/``. Single-user notifications go to the
+``user_<id>`` group with their id.
+"""
+
+from itertools import islice
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from . import framing
+from .models import Enrollment, Material, Notification, Submission
+
+CHUNK_SIZE = 1000
+
+
+def user_group(user_id):
+    return f"user_{user_id}"
+
+
+def students_group(classroom_id):
+    return f"students_{classroom_id}"
+
+
+def payload(notification):
+    return {
+        "id": notification.id,
+        "kind": notification.kind,
+        "title": notification.title,
+        "data": notification.data,
+        "is_read": notification.is_read,
+        "created_at": notification.created_at.isoformat().replace("+00:00", "Z"),
+    }
+
+
+def push(group, data):
+    layer = get_channel_layer()
+    if layer is not None:
+        event = framing.make_event("notification.message", data)
+        async_to_sync(layer.group_send)(group, event)
+
+
+def create(user_ids, kind, title, data):
+    """Write one notification per user in chunks, return the first row."""
+    user_ids = iter(user_ids)
+    first = None
+    with transaction.atomic():
+        while chunk := list(islice(user_ids, CHUNK_SIZE)):
+            rows = Notification.objects.bulk_create(
+                Notification(user_id=uid, kind=kind, title=title, data=data)
+                for uid in chunk
+            )
+            first = first or rows[0]
+    return first
+
+
+def notify_classroom(classroom_id, kind, title, data):
+    students = Enrollment.objects.filter(classroom_id=classroom_id)
+    first = create(students.values_list("user_id", flat=True), kind, title, data)
+    if first is not None:
+        shared = payload(first)
+        del shared["id"]
+        group = students_group(classroom_id)
+        transaction.on_commit(lambda: push(group, shared))
+    return first
+
+
+def notify_user(user_id, kind, title, data):
+    notification = create([user_id], kind, title, data)
+    transaction.on_commit(lambda: push(user_group(user_id), payload(notification)))
+    return notification
+
+
+def notify_material_published(material_id):
+    material = Material.objects.select_related("classroom").get(id=material_id)
+    return notify_classroom(
+        material.classroom_id,
+        Notification.MATERIAL_PUBLISHED,
+        f"New material in {material.classroom.title}: {material.title}",
+        {"classroom": str(material.classroom_id), "material": str(material.id)},
+    )
+
+
+def notify_submission_graded(submission_id):
+    submission = Submission.objects.select_related("material").get(id=submission_id)
+    return notify_user(
+        submission.student_id,
+        Notification.SUBMISSION_GRADED,
+        f"Your submission for {submission.material.title} was graded",
+        {
+            "material": str(submission.material_id),
+            "submission": str(submission.id),
+            "grade": submission.grade,
+        },
+    )
@@ -0,0 +1,107 @@
+"""
+Pre-rendered, pre-compressed pages for hot list endpoints.
+
+A list whose output is the same for everyone allowed to see it (a
+classroom's materials, a material's chat) or for every request of one user
+(their direct messages) is cached as rendered JSON bytes plus its gzip /
+brotli variants, keyed by the resource's version. Signals bump the version
+after every committed write (api/signals.py), so many students opening the
+same classroom share one serialization and one compression, and a change is
+visible on the next request. Views opt in with ``page_scope`` and
+``@cached_list``.
+"""
+
+import functools
+import hashlib
+import uuid
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.response import Response
+from . import compression
+from .dbrouting import reads_from_replica
+
+# bounds staleness from writes that send no signal (bulk deletes, renames)
+PAGE_TTL = 5 * 60
+
+
+def version_key(scope):
+    return f"pagever:{scope}"
+
+
+def version(scope):
+    key = version_key(scope)
+    current = cache.get(key)
+    if current is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        current = cache.get(key)
+    return current
+
+
+def bump(scope):
+    # after commit, so a concurrent request can't cache the old rows again
+    transaction.on_commit(lambda: cache.set(version_key(scope), uuid.uuid4().hex, None))
+
+
+def page_key(request, scope):
+    path = f"{request.get_host()}{request.get_full_path()}"
+    digest = hashlib.sha1(path.encode()).hexdigest()
+    return f"page:{scope}:{version(scope)}:{digest}"
+
+
+def respond(content_type, body, encoding):
+    response = HttpResponse(body, content_type=content_type)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    patch_vary_headers(response, ("Accept", "Accept-Encoding"))
+    return response
+
+
+def cached_list(method):
+    """
+    Serve ``list`` from the page cache when ``self.page_scope(request)``
+    names a resource (None skips the cache) and JSON was negotiated.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        scope = self.page_scope(request)
+        if scope is None or request.accepted_renderer.format != "json":
+            return method(self, request, *args, **kwargs)
+        key = page_key(request, scope)
+        encoding = compression.negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        variant_key = f"{key}:{encoding or 'identity'}"
+        found = cache.get_many([variant_key, f"{key}:identity"])
+        if variant_key in found:
+            content_type, body, used = found[variant_key]
+            return respond(content_type, body, used)
+
+        identity = found.get(f"{key}:identity")
+        if identity is None:
+            # the primary, a lagging replica must not fill the shared page
+            with reads_from_replica(False):
+                response = method(self, request, *args, **kwargs)
+            if not isinstance(response, Response) or response.status_code != 200:
+                return response
+            renderer = request.accepted_renderer
+            body = renderer.render(
+                response.data, request.accepted_media_type, self.get_renderer_context()
+            )
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type = f"{content_type}; charset={renderer.charset}"
+            identity = (content_type, body, None)
+            cache.set(f"{key}:identity", identity, PAGE_TTL)
+
+        content_type, body, _ = identity
+        used = None
+        if encoding is not None and len(body) >= compression.MIN_LENGTH:
+            compressed = compression.compress(body, encoding, best=True)
+            if len(compressed) < len(body):
+                body, used = compressed, encoding
+        if used is not None:
+            cache.set(variant_key, (content_type, body, used), PAGE_TTL)
+        return respond(content_type, body, used)
+
+    return wrapper
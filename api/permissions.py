@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from .membership import classroom_id_of, get_membership
 
 
 class IsTeacher(permissions.BasePermission):
@@ -15,3 +16,17 @@ class IsTeacherOrReadOnly(permissions.BasePermission):
         return bool(
             request.user and request.user.is_authenticated and request.user.is_teacher
         )
+
+
+class IsClassroomMember(permissions.BasePermission):
+    """
+    Object access by classroom membership (see api.membership): members of
+    the object's classroom can read it, only its teacher can change it.
+    """
+
+    def has_object_permission(self, request, view, obj):
+        membership = get_membership(request)
+        classroom_id = classroom_id_of(obj)
+        if request.method in permissions.SAFE_METHODS:
+            return membership.is_member(classroom_id)
+        return membership.teaches(classroom_id)
@@ -0,0 +1,191 @@
+"""
+Bulk student accounts (``POST /api/users/bulk/``, ``manage.py provision_students``).
+
+The API stores the rows on a ``ProvisionJob`` and answers 202 at once; the
+``provisioning.run`` task creates the accounts and writes its progress back
+to the job, which the client polls at ``GET /api/users/bulk/<id>/``. Invalid
+rows and usernames taken in the meantime are recorded per row, the other
+rows are still created. The submitted passwords stay on the job only until a
+worker starts it, at most ``JOB_TTL`` (``expire_jobs``). Passwords are hashed on all cores (api/hashing.py)
+while earlier chunks are inserted with ``bulk_create``; students can be
+enrolled into a classroom in the same pass.
+"""
+
+from datetime import timedelta
+from itertools import islice
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .hashing import hash_passwords
+from .models import ChangeLog, Enrollment, ProvisionJob, Task
+from .sync import record_many
+
+User = get_user_model()
+
+CHUNK_SIZE = 500
+MAX_ROWS = 10000
+# jobs not started by then are failed and their rows (with passwords) dropped
+JOB_TTL = timedelta(hours=2)
+
+
+def clean_rows(rows):
+    """
+    Return (students, errors); students are {"row", "username", "password",
+    "email"}, rows with an error are left out.
+    """
+    students, errors, lines = [], [], {}
+    for line, row in enumerate(rows, 1):
+        username = str(row.get("username") or "").strip()
+        password = str(row.get("password") or "")
+        if not username or not password:
+            errors.append({"row": line, "detail": "username and password required"})
+        elif username in lines:
+            errors.append({"row": line, "detail": f"duplicate username {username}"})
+        elif invalid := field_errors(
+            username=username, email=str(row.get("email") or "").strip()
+        ):
+            errors.append({"row": line, "detail": invalid})
+        else:
+            lines[username] = line
+            email = str(row.get("email") or "").strip()
+            students.append(
+                {
+                    "row": line,
+                    "username": username,
+                    "password": password,
+                    "email": email,
+                }
+            )
+    if len(students) > MAX_ROWS:
+        errors.append({"row": None, "detail": f"at most {MAX_ROWS} rows per batch"})
+        return [], errors
+    taken = set()
+    for chunk in chunks(lines, CHUNK_SIZE):
+        taken.update(
+            User.all_objects.filter(username__in=chunk).values_list(
+                "username", flat=True
+            )
+        )
+    errors.extend({"row": lines[name], "detail": taken_detail(name)} for name in taken)
+    students = [s for s in students if s["username"] not in taken]
+    errors.sort(key=lambda e: e["row"])
+    return students, errors
+
+
+def field_errors(**values):
+    # the model field validators (charset, max_length, email), as on register
+    for name, value in values.items():
+        try:
+            User._meta.get_field(name).run_validators(value)
+        except ValidationError as e:
+            return f"{name}: {' '.join(e.messages)}"
+    return None
+
+
+def taken_detail(username):
+    return f"username {username} already exists"
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def provision(students, classroom=None, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Create the (already cleaned) students, optionally enrolling them into
+    ``classroom``. Yields a progress dict after every chunk; "errors" lists
+    the rows of that chunk that could not be created.
+    """
+    total = len(students)
+    created = 0
+    hashes = hash_passwords((s["password"] for s in students), workers)
+    for chunk in chunks(zip(students, hashes), chunk_size):
+        try:
+            users, errors = create(chunk, classroom), []
+        except IntegrityError:
+            # a username was taken since clean_rows, retry row by row
+            users, errors = [], []
+            for row in chunk:
+                try:
+                    users.extend(create([row], classroom))
+                except IntegrityError:
+                    errors.append(
+                        {
+                            "row": row[0]["row"],
+                            "detail": taken_detail(row[0]["username"]),
+                        }
+                    )
+        created += len(users)
+        yield {"created": created, "total": total, "errors": errors}
+
+
+def create(chunk, classroom):
+    with transaction.atomic():
+        users = User.objects.bulk_create(
+            User(username=s["username"], email=s["email"], password=hashed)
+            for s, hashed in chunk
+        )
+        if classroom is not None:
+            enroll(users, classroom)
+    return users
+
+
+def enroll(users, classroom):
+    if any(user.pk is None for user in users):
+        # backends without RETURNING don't set pks on bulk_create
+        users = User.objects.filter(username__in=[u.username for u in users])
+    enrollments = Enrollment.objects.bulk_create(
+        Enrollment(user=user, classroom=classroom) for user in users
+    )
+    if any(e.pk is None for e in enrollments):
+        enrollments = Enrollment.objects.filter(
+            classroom=classroom, user__in=[u.pk for u in users]
+        )
+    # bulk_create skips post_save, log the joins for delta sync here
+    record_many(
+        ("enrollment", e.pk, classroom.pk, ChangeLog.UPSERT, e.user_id)
+        for e in enrollments
+    )
+
+
+def run_job(job_id):
+    """Body of the ``provisioning.run`` task."""
+    expire_jobs()
+    jobs = ProvisionJob.objects.filter(pk=job_id)
+    job = jobs.filter(status__in=(Task.PENDING, Task.RUNNING)).first()
+    if job is None:
+        return
+    # the rows live in memory from here on
+    jobs.update(status=Task.RUNNING, rows=[])
+    try:
+        students, errors = clean_rows(job.rows)
+        jobs.update(failed=len(errors), errors=errors)
+        for step in provision(students, job.classroom):
+            errors.extend(step["errors"])
+            jobs.update(created=step["created"], failed=len(errors), errors=errors)
+    except Exception:
+        jobs.update(status=Task.FAILED, finished_at=timezone.now())
+        raise
+    errors.sort(key=lambda e: e["row"] or 0)
+    jobs.update(
+        status=Task.DONE,
+        failed=len(errors),
+        errors=errors,
+        finished_at=timezone.now(),
+    )
+
+
+def expire_jobs():
+    """Fail the jobs no worker started within JOB_TTL, dropping their rows."""
+    return ProvisionJob.objects.filter(
+        status=Task.PENDING,
+        created_at__lt=timezone.now() - JOB_TTL,
+    ).update(
+        status=Task.FAILED,
+        rows=[],
+        errors=[{"row": None, "detail": "expired before a worker started it"}],
+        finished_at=timezone.now(),
+    )
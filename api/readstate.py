@@ -0,0 +1,98 @@
+"""
+Per-user read watermarks for material chats and direct messages.
+
+One ChatReadMarker row per (user, thread) holds the last read message id.
+Unread counts are range counts on (material, id) / (recipient, sender, id)
+indexes, capped at UNREAD_CAP so a busy thread costs at most CAP+1 index
+entries.
+"""
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import ChatReadMarker, ClassChatMessage, DirectChatMessage
+
+UNREAD_CAP = 99
+# direct_unread without explicit peers looks at who sent the last
+# RECENT_MESSAGES messages, at most MAX_PEERS of them
+RECENT_MESSAGES = 500
+MAX_PEERS = 50
+
+
+def mark_read(user_id, last_read_id, material_id=None, peer_id=None):
+    """Move the watermark forward, never back."""
+    thread = {"material_id": material_id} if material_id else {"peer_id": peer_id}
+    markers = ChatReadMarker.objects.filter(user_id=user_id, **thread)
+    if markers.filter(last_read_id__lt=last_read_id).update(
+        last_read_id=last_read_id, updated_at=timezone.now()
+    ):
+        return
+    try:
+        with transaction.atomic():
+            markers.get_or_create(
+                user_id=user_id, **thread, defaults={"last_read_id": last_read_id}
+            )
+    except IntegrityError:
+        # created concurrently, move it forward if still behind
+        markers.filter(last_read_id__lt=last_read_id).update(
+            last_read_id=last_read_id, updated_at=timezone.now()
+        )
+
+
+def display(count, cap=UNREAD_CAP):
+    return f"{cap}+" if count > cap else count
+
+
+def capped_count(qs, cap=UNREAD_CAP):
+    # SELECT COUNT(*) FROM (SELECT id ... LIMIT cap + 1)
+    return qs.values("id")[: cap + 1].count()
+
+
+def material_unread(user, material_ids):
+    """{material_id: count or "99+"} for the given materials."""
+    markers = {
+        str(material_id): last_read_id
+        for material_id, last_read_id in ChatReadMarker.objects.filter(
+            user=user, material_id__in=material_ids
+        ).values_list("material_id", "last_read_id")
+    }
+    counts = {}
+    for material_id in material_ids:
+        # sender is in the (material, id, sender) index: an index-only count
+        qs = ClassChatMessage.objects.filter(
+            material_id=material_id, id__gt=markers.get(str(material_id), 0)
+        ).exclude(sender=user)
+        counts[str(material_id)] = display(capped_count(qs))
+    return counts
+
+
+def recent_peers(user):
+    # senders among the newest messages, not a scan of the whole inbox
+    senders = (
+        DirectChatMessage.objects.filter(recipient=user)
+        .order_by("-id")
+        .values_list("sender_id", flat=True)[:RECENT_MESSAGES]
+    )
+    return list(dict.fromkeys(senders))[:MAX_PEERS]
+
+
+def direct_unread(user, peer_ids=None):
+    """
+    {peer_id: count or "99+"} for the given peers (default: recent_peers)
+    that have unread messages.
+    """
+    if peer_ids is None:
+        peer_ids = recent_peers(user)
+    markers = dict(
+        ChatReadMarker.objects.filter(user=user, peer_id__in=peer_ids).values_list(
+            "peer_id", "last_read_id"
+        )
+    )
+    counts = {}
+    for peer_id in peer_ids:
+        qs = DirectChatMessage.objects.filter(
+            recipient=user, sender_id=peer_id, id__gt=markers.get(peer_id, 0)
+        )
+        count = capped_count(qs)
+        if count:
+            counts[peer_id] = display(count)
+    return counts
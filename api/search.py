@@ -0,0 +1,69 @@
+"""
+DM recipient autocomplete: username/email search over people who share a
+classroom with the searcher.
+
+Matching is case-insensitive: the query is lowercased once and used for the
+cache key and every comparison, always against lower(username) and
+lower(email) so the expression indexes apply. On postgres queries of 3+
+characters use LIKE '%q%' backed by the pg_trgm GIN indexes (migration
+0020), shorter ones LIKE 'q%' backed by the text_pattern_ops indexes
+(0015). Other databases match the prefix as a range, lower(col) >= q AND
+< q + U+FFFF, which the lower(col) indexes of 0020 serve on SQLite.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Lower
+from .models import Classroom, Enrollment
+from .serializers import UserSerializer
+
+User = get_user_model()
+
+MIN_LENGTH = 2
+TRIGRAM_MIN_LENGTH = 3
+LIMIT = 10
+CACHE_TTL = 30
+
+
+def classmates(user, membership):
+    classroom_ids = membership.member_ids
+    return User.objects.filter(
+        Q(
+            id__in=Enrollment.objects.filter(classroom_id__in=classroom_ids).values(
+                "user_id"
+            )
+        )
+        | Q(id__in=Classroom.objects.filter(id__in=classroom_ids).values("teacher_id"))
+    ).exclude(id=user.id)
+
+
+def search_users(user, q, membership):
+    q = q.strip().lower()
+    if len(q) < MIN_LENGTH:
+        return []
+    key = f"usersearch:{user.id}:{q}"
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    qs = classmates(user, membership).alias(
+        username_lower=Lower("username"), email_lower=Lower("email")
+    )
+    if connection.vendor != "postgresql":
+        match = Q(username_lower__gte=q, username_lower__lt=q + "\uffff") | Q(
+            email_lower__gte=q, email_lower__lt=q + "\uffff"
+        )
+    elif len(q) >= TRIGRAM_MIN_LENGTH:
+        match = Q(username_lower__contains=q) | Q(email_lower__contains=q)
+    else:
+        match = Q(username_lower__startswith=q) | Q(email_lower__startswith=q)
+    qs = (
+        qs.filter(match)
+        .only("id", "username", "email", "is_teacher")
+        .order_by("username")[:LIMIT]
+    )
+    results = UserSerializer(qs, many=True).data
+    cache.set(key, results, CACHE_TTL)
+    return results
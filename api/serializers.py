@@ -1,4 +1,7 @@
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+from . import thumbnails
+from .membership import get_membership
 from .models import (
     User,
     Classroom,
@@ -7,12 +10,94 @@ from .models import (
     Submission,
     ClassChatMessage,
     DirectChatMessage,
+    Notification,
+    ProvisionJob,
 )
 from django.contrib.auth import get_user_model
+from django.contrib.auth.validators import UnicodeUsernameValidator
 
 UserModel = get_user_model()
 
 
+def query_param_set(request, name):
+    """?name=a,b -> {"a", "b"}; None when the parameter is absent."""
+    if request is None or name not in request.query_params:
+        return None
+    return {f for f in request.query_params[name].split(",") if f}
+
+
+class DynamicFieldsMixin:
+    """
+    ?fields=id,title  only render these fields
+    ?expand=sender    nest these relations, other expandable relations are
+                      rendered as ids. Without ?expand every expandable
+                      relation is nested (the original payload).
+    """
+
+    expandable_fields = ()
+    # fields computed from columns: {field: (column, ...)}
+    computed_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None:
+            return
+        fields = query_param_set(request, "fields")
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+        expand = self.expanded_fields(request)
+        for name in self.expandable_fields:
+            if name in self.fields and name not in expand:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    @classmethod
+    def expanded_fields(cls, request):
+        expand = query_param_set(request, "expand")
+        if expand is None:
+            return set(cls.expandable_fields)
+        return set(cls.expandable_fields) & expand
+
+    @classmethod
+    def optimize_queryset(cls, qs, request):
+        """Load only the columns and relations the response will render."""
+        fields = query_param_set(request, "fields")
+        expand = cls.expanded_fields(request)
+        if fields is not None:
+            expand &= fields
+        if expand:
+            qs = qs.select_related(*expand)
+        if fields is None:
+            return qs
+        model = cls.Meta.model
+        concrete = {f.name for f in model._meta.concrete_fields}
+        only = {model._meta.pk.name}
+        for name in fields:
+            if name in expand:
+                nested = cls._declared_fields[name]
+                only.update(f"{name}__{f}" for f in nested.Meta.fields)
+            elif name in concrete:
+                only.add(name)
+            elif name in cls.computed_fields:
+                only.update(cls.computed_fields[name])
+        return qs.only(*only)
+
+    @classmethod
+    def trim_rows(cls, rows, request):
+        """Apply ?fields/?expand to already rendered rows (e.g. archived chat)."""
+        fields = query_param_set(request, "fields")
+        expand = cls.expanded_fields(request)
+        trimmed = []
+        for row in rows:
+            row = {k: v for k, v in row.items() if fields is None or k in fields}
+            for name in cls.expandable_fields:
+                if name not in expand and isinstance(row.get(name), dict):
+                    row[name] = row[name]["id"]
+            trimmed.append(row)
+        return trimmed
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserModel
@@ -26,6 +111,18 @@ class RegisterSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserModel
         fields = ("username", "email", "password", "is_teacher")
+        extra_kwargs = {
+            # soft-deleted users keep their username until purged
+            "username": {
+                "validators": [
+                    UnicodeUsernameValidator(),
+                    UniqueValidator(
+                        queryset=UserModel.all_objects.all(),
+                        message="A user with that username already exists.",
+                    ),
+                ]
+            }
+        }
 
     def create(self, validated_data):
         password = validated_data.pop("password")
@@ -35,7 +132,8 @@ class RegisterSerializer(serializers.ModelSerializer):
         return user
 
 
-class ClassroomSerializer(serializers.ModelSerializer):
+class ClassroomSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ("teacher",)
     teacher = UserSerializer(read_only=True)
 
     class Meta:
@@ -44,21 +142,24 @@ class ClassroomSerializer(serializers.ModelSerializer):
         read_only_fields = ("join_token",)
 
 
-class MaterialSerializer(serializers.ModelSerializer):
+class MaterialSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Material
         fields = ("id", "classroom", "title", "youtube_url", "created_at")
 
 
-class EnrollmentSerializer(serializers.ModelSerializer):
+class EnrollmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Enrollment
         fields = ("id", "user", "classroom", "joined_at")
         read_only_fields = ("joined_at",)
 
 
-class SubmissionSerializer(serializers.ModelSerializer):
+class SubmissionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ("student",)
+    computed_fields = {"thumbnails": ("file", "thumbnails_ready")}
     student = UserSerializer(read_only=True)
+    thumbnails = serializers.SerializerMethodField()
 
     class Meta:
         model = Submission
@@ -71,11 +172,31 @@ class SubmissionSerializer(serializers.ModelSerializer):
             "created_at",
             "graded",
             "grade",
+            "thumbnails",
         )
         read_only_fields = ("student", "created_at")
 
+    def validate(self, attrs):
+        # grading fields are read-only for anyone but the classroom teacher
+        request = self.context.get("request")
+        material = attrs.get("material") or getattr(self.instance, "material", None)
+        if request is not None and not (
+            material is not None
+            and get_membership(request).teaches(material.classroom_id)
+        ):
+            attrs.pop("graded", None)
+            attrs.pop("grade", None)
+        return attrs
 
-class ClassChatMessageSerializer(serializers.ModelSerializer):
+    def get_thumbnails(self, obj):
+        # {"480": url, "160": url} for images once generated, else null
+        return thumbnails.absolute_urls(
+            obj.file.name, obj.thumbnails_ready, self.context.get("request")
+        )
+
+
+class ClassChatMessageSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ("sender",)
     sender = UserSerializer(read_only=True)
 
     class Meta:
@@ -83,7 +204,8 @@ class ClassChatMessageSerializer(serializers.ModelSerializer):
         fields = ("id", "material", "sender", "content", "timestamp")
 
 
-class DirectChatMessageSerializer(serializers.ModelSerializer):
+class DirectChatMessageSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ("sender",)
     sender = UserSerializer(read_only=True)
     recipient = serializers.PrimaryKeyRelatedField(queryset=UserModel.objects.all())
 
@@ -91,3 +213,57 @@ class DirectChatMessageSerializer(serializers.ModelSerializer):
         model = DirectChatMessage
         fields = ("id", "sender", "recipient", "content", "timestamp")
         read_only_fields = ("sender", "timestamp")
+
+
+class NotificationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ("id", "kind", "title", "data", "is_read", "created_at")
+        read_only_fields = fields
+
+
+class BulkProvisionSerializer(serializers.Serializer):
+    # rows are checked one by one by the job (api/provisioning.py)
+    students = serializers.ListField(child=serializers.DictField())
+    classroom = serializers.PrimaryKeyRelatedField(
+        queryset=Classroom.objects.all(),
+        pk_field=serializers.UUIDField(),
+        required=False,
+        allow_null=True,
+    )
+
+
+class ProvisionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProvisionJob
+        fields = (
+            "id",
+            "status",
+            "classroom",
+            "total",
+            "created",
+            "failed",
+            "errors",
+            "created_at",
+            "finished_at",
+        )
+        read_only_fields = fields
+
+
+class ClassroomCloneSerializer(serializers.ModelSerializer):
+    copy_enrollments = serializers.BooleanField(default=False)
+
+    class Meta:
+        model = Classroom
+        fields = ("title", "copy_enrollments")
+        extra_kwargs = {"title": {"required": False}}
+
+
+class ClassChatReadSerializer(serializers.Serializer):
+    material = serializers.PrimaryKeyRelatedField(queryset=Material.objects.all())
+    last_read_id = serializers.IntegerField(min_value=0)
+
+
+class DirectChatReadSerializer(serializers.Serializer):
+    peer = serializers.PrimaryKeyRelatedField(queryset=UserModel.objects.all())
+    last_read_id = serializers.IntegerField(min_value=0)
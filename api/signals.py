@@ -0,0 +1,95 @@
+# append sync change log entries (see api/sync.py) for every write
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import (
+    ChangeLog,
+    ClassChatMessage,
+    Classroom,
+    DirectChatMessage,
+    Enrollment,
+    Material,
+    Submission,
+)
+from .pagecache import bump
+from .sync import record
+
+
+@receiver(post_save, sender=Classroom)
+def classroom_saved(sender, instance, **kwargs):
+    record("classroom", instance.id, instance.id)
+
+
+@receiver(post_delete, sender=Classroom)
+def classroom_deleted(sender, instance, **kwargs):
+    record("classroom", instance.id, instance.id, ChangeLog.DELETE, instance.teacher_id)
+
+
+@receiver(post_save, sender=Material)
+def material_saved(sender, instance, **kwargs):
+    record("material", instance.id, instance.classroom_id)
+    bump(f"classroom:{instance.classroom_id}")
+
+
+@receiver(post_delete, sender=Material)
+def material_deleted(sender, instance, **kwargs):
+    record("material", instance.id, instance.classroom_id, ChangeLog.DELETE)
+    bump(f"classroom:{instance.classroom_id}")
+
+
+@receiver(post_save, sender=Submission)
+def submission_saved(sender, instance, **kwargs):
+    classroom_id = Material.objects.values_list("classroom_id", flat=True).get(
+        id=instance.material_id
+    )
+    record("submission", instance.id, classroom_id, user_id=instance.student_id)
+
+
+@receiver(post_delete, sender=Submission)
+def submission_deleted(sender, instance, **kwargs):
+    classroom_id = (
+        Material.objects.filter(id=instance.material_id)
+        .values_list("classroom_id", flat=True)
+        .first()
+    )
+    if classroom_id is not None:
+        record(
+            "submission",
+            instance.id,
+            classroom_id,
+            ChangeLog.DELETE,
+            instance.student_id,
+        )
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_saved(sender, instance, created, **kwargs):
+    if created:
+        record(
+            "enrollment",
+            instance.id,
+            instance.classroom_id,
+            user_id=instance.user_id,
+        )
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    record(
+        "enrollment",
+        instance.id,
+        instance.classroom_id,
+        ChangeLog.DELETE,
+        instance.user_id,
+    )
+
+
+# cached list pages (see api/pagecache.py)
+@receiver([post_save, post_delete], sender=ClassChatMessage)
+def class_chat_changed(sender, instance, **kwargs):
+    bump(f"material:{instance.material_id}")
+
+
+@receiver([post_save, post_delete], sender=DirectChatMessage)
+def direct_chat_changed(sender, instance, **kwargs):
+    bump(f"dm:{instance.sender_id}")
+    bump(f"dm:{instance.recipient_id}")
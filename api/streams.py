@@ -0,0 +1,215 @@
+"""
+Chat delivery for clients whose network blocks websockets.
+
+- ``GET /api/stream/material/<id>/``, ``/api/stream/direct/<user_id>/``:
+  Server-Sent Events, one open connection per thread.
+- ``GET /api/poll/material/<id>/?after=<id>``, ``/api/poll/direct/...``:
+  long-poll, returns as soon as there is something newer than ``after``.
+
+Both subscribe to the same channel-layer groups as the consumers in
+api/consumers.py, so they get the exact frames the websockets get. Messages
+missed while disconnected are read from the database (``Last-Event-ID`` /
+``after``). ``EventSource`` can't set headers, so the JWT may also be passed
+as ``?token=``. Needs an ASGI server.
+"""
+
+import asyncio
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from . import framing
+from .consumers import (
+    HISTORY_LIMIT,
+    can_join_material,
+    class_message_payload,
+    direct_group,
+    direct_message_payload,
+    ensure_fresh_connection,
+    material_group,
+)
+from .dbrouting import areplica_allowed, reads_from_replica
+from .models import ClassChatMessage, DirectChatMessage
+
+# comment line sent when idle, keeps proxies from closing the stream
+KEEPALIVE = 15
+POLL_TIMEOUT = 25
+RETRY_MS = 3000
+
+
+class Thread:
+    """A chat thread: its channel-layer group and how to read missed messages."""
+
+    def __init__(self, group, queryset, to_payload):
+        self.group = group
+        self.queryset = queryset
+        self.to_payload = to_payload
+
+    async def missed(self, user, after):
+        await ensure_fresh_connection()
+        qs = (
+            self.queryset.filter(id__gt=after)
+            .select_related("sender")
+            .order_by("id")[:HISTORY_LIMIT]
+        )
+        with reads_from_replica(await areplica_allowed(user.id)):
+            return [self.to_payload(msg) async for msg in qs]
+
+
+async def material_thread(user, material_id):
+    if not await can_join_material({"user": user}, material_id):
+        return None
+    return Thread(
+        material_group(material_id),
+        ClassChatMessage.objects.filter(material_id=material_id),
+        class_message_payload,
+    )
+
+
+async def direct_thread(user, other_user_id):
+    return Thread(
+        direct_group(user.id, other_user_id),
+        DirectChatMessage.objects.filter(
+            Q(sender_id=user.id, recipient_id=other_user_id)
+            | Q(sender_id=other_user_id, recipient_id=user.id)
+        ),
+        direct_message_payload,
+    )
+
+
+async def authenticate(request):
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw = auth.get_raw_token(header) if header else request.GET.get("token")
+    if not raw:
+        return None
+    try:
+        token = auth.get_validated_token(raw)
+        return await sync_to_async(auth.get_user)(token)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def message_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def sse(payload, text):
+    return f"id: {payload['id']}\ndata: {text}\n\n"
+
+
+async def next_event(layer, channel, receiving, timeout):
+    """
+    Wait up to ``timeout`` for the pending ``receiving`` task; returns
+    (event or None, receiving). The receive is never cancelled on a timeout:
+    on the pub/sub layer that would unsubscribe the channel and drop messages.
+    """
+    if receiving is None:
+        receiving = asyncio.ensure_future(layer.receive(channel))
+    done, _ = await asyncio.wait({receiving}, timeout=timeout)
+    if not done:
+        return None, receiving
+    return receiving.result(), None
+
+
+async def stop_receiving(receiving):
+    # the subscription is going away anyway
+    if receiving is not None:
+        receiving.cancel()
+        await asyncio.gather(receiving, return_exceptions=True)
+
+
+async def event_stream(user, thread, last_id):
+    layer = get_channel_layer()
+    channel = await layer.new_channel()
+    # subscribe before reading the db so nothing falls in between
+    await layer.group_add(thread.group, channel)
+    receiving = None
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        if last_id is not None:
+            for payload in await thread.missed(user, last_id):
+                last_id = payload["id"]
+                yield sse(payload, framing.dumps(payload))
+        while True:
+            event, receiving = await next_event(layer, channel, receiving, KEEPALIVE)
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            payload = framing.event_payload(event)
+            if last_id is not None and payload["id"] <= last_id:
+                continue  # already sent from the db
+            last_id = payload["id"]
+            yield sse(payload, event["text"])
+    finally:
+        await stop_receiving(receiving)
+        await layer.group_discard(thread.group, channel)
+
+
+async def stream(request, make_thread, key):
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse({"detail": "auth required"}, status=401)
+    thread = await make_thread(user, key)
+    if thread is None:
+        return JsonResponse({"detail": "not allowed"}, status=403)
+    last_id = message_id(
+        request.headers.get("Last-Event-ID") or request.GET.get("after")
+    )
+    response = StreamingHttpResponse(
+        event_stream(user, thread, last_id),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: don't buffer the stream
+    return response
+
+
+async def poll(request, make_thread, key):
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse({"detail": "auth required"}, status=401)
+    thread = await make_thread(user, key)
+    if thread is None:
+        return JsonResponse({"detail": "not allowed"}, status=403)
+    after = message_id(request.GET.get("after"))
+    layer = get_channel_layer()
+    channel = await layer.new_channel()
+    await layer.group_add(thread.group, channel)
+    receiving = None
+    try:
+        messages = await thread.missed(user, after) if after is not None else []
+        if not messages:
+            event, receiving = await next_event(layer, channel, None, POLL_TIMEOUT)
+            # the rest of a burst is picked up by the next poll's db read
+            if event is not None:
+                payload = framing.event_payload(event)
+                if after is None or payload["id"] > after:
+                    messages = [payload]
+    finally:
+        await stop_receiving(receiving)
+        await layer.group_discard(thread.group, channel)
+    last_id = messages[-1]["id"] if messages else after
+    return JsonResponse({"messages": messages, "last_id": last_id})
+
+
+async def material_stream(request, material_id):
+    return await stream(request, material_thread, material_id)
+
+
+async def direct_stream(request, other_user_id):
+    return await stream(request, direct_thread, other_user_id)
+
+
+async def material_poll(request, material_id):
+    return await poll(request, material_thread, material_id)
+
+
+async def direct_poll(request, other_user_id):
+    return await poll(request, direct_thread, other_user_id)
@@ -0,0 +1,179 @@
+"""
+Delta sync for offline clients (``GET /api/sync/?since=<token>``).
+
+Every write to a classroom, material, submission or enrollment appends a
+ChangeLog row (api/signals.py; bulk writers call ``record_many``). A client
+keeps the last token it got and only receives what changed after it in its
+own classrooms: current rows for upserts, tombstones for deletions. Joining a
+classroom brings its full snapshot, leaving it brings a classroom tombstone.
+
+The token is ``seq``, not the row id: ids are taken at INSERT, so a slow
+transaction could commit entries below a token clients already passed.
+``seq`` is assigned after commit, one numbering at a time, so numbers
+become visible in increasing order.
+"""
+
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from .membership import get_membership
+from .models import ChangeLog, Classroom, Material, Submission
+from .serializers import ClassroomSerializer, MaterialSerializer, SubmissionSerializer
+
+PAGE_SIZE = 500
+SEQUENCE_BATCH = 1000
+# pg_advisory_xact_lock key serializing assign_sequence
+SEQUENCE_LOCK = 4300001
+
+MODELS = {
+    "classroom": (Classroom, ClassroomSerializer),
+    "material": (Material, MaterialSerializer),
+    "submission": (Submission, SubmissionSerializer),
+}
+
+
+def record(model, object_id, classroom_id, op=ChangeLog.UPSERT, user_id=None):
+    ChangeLog.objects.create(
+        model=model,
+        object_id=str(object_id),
+        classroom_id=classroom_id,
+        op=op,
+        user_id=user_id,
+    )
+    sequence_after_commit()
+
+
+def record_many(entries):
+    """entries: iterable of (model, object_id, classroom_id, op, user_id)."""
+    ChangeLog.objects.bulk_create(
+        ChangeLog(
+            model=model,
+            object_id=str(object_id),
+            classroom_id=classroom_id,
+            op=op,
+            user_id=user_id,
+        )
+        for model, object_id, classroom_id, op, user_id in entries
+    )
+    sequence_after_commit()
+
+
+def sequence_after_commit():
+    # once per transaction, however many entries it logs
+    pending = transaction.get_connection().run_on_commit
+    if not any(func is assign_sequence for _, func, _ in pending):
+        transaction.on_commit(assign_sequence)
+
+
+def assign_sequence():
+    """
+    Number committed entries that have no seq yet (also ones left behind by
+    a worker that died after commit), continuing after the highest number.
+    """
+    while True:
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                # held until commit: the next numbering starts after this one
+                # is visible (sqlite serializes writers anyway)
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s)", [SEQUENCE_LOCK])
+            entries = list(
+                ChangeLog.objects.filter(seq__isnull=True)
+                .order_by("id")
+                .only("id")[:SEQUENCE_BATCH]
+            )
+            if not entries:
+                return
+            top = ChangeLog.objects.aggregate(top=Max("seq"))["top"] or 0
+            for seq, entry in enumerate(entries, top + 1):
+                entry.seq = seq
+            ChangeLog.objects.bulk_update(entries, ["seq"])
+        if len(entries) < SEQUENCE_BATCH:
+            return
+
+
+def parse_token(token):
+    try:
+        return max(int(token or 0), 0)
+    except ValueError:
+        return 0
+
+
+def visible_entries(user, taught_ids, member_ids):
+    """Log entries this user may see."""
+    shared = Q(classroom_id__in=member_ids) & (
+        Q(user_id__isnull=True) | Q(classroom_id__in=taught_ids)
+    )
+    return ChangeLog.objects.filter(shared | Q(user_id=user.id))
+
+
+def changes_since(user, since, request, limit=PAGE_SIZE):
+    membership = get_membership(request)
+    taught_ids, member_ids = membership.taught, membership.member_ids
+    entries = list(
+        visible_entries(user, taught_ids, member_ids)
+        .filter(seq__gt=since)
+        .order_by("seq")
+        .values_list("seq", "model", "object_id", "classroom_id", "op", "user_id")[
+            : limit + 1
+        ]
+    )
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    # latest op per object wins
+    latest = {}
+    joined, left = set(), set()
+    for _, model, object_id, classroom_id, op, user_id in entries:
+        if model == "enrollment":
+            if user_id == user.id:
+                classroom_id = str(classroom_id)
+                (joined if op == ChangeLog.UPSERT else left).add(classroom_id)
+                (left if op == ChangeLog.UPSERT else joined).discard(classroom_id)
+            continue
+        latest[(model, object_id)] = op
+
+    upserts = {model: set() for model in MODELS}
+    deleted = []
+    for (model, object_id), op in latest.items():
+        if op == ChangeLog.UPSERT:
+            upserts[model].add(object_id)
+        else:
+            deleted.append({"model": model, "id": object_id})
+    deleted.extend(
+        {"model": "classroom", "id": classroom_id} for classroom_id in left - member_ids
+    )
+
+    context = {"request": request}
+    querysets = {
+        "classroom": Classroom.objects.filter(
+            Q(id__in=upserts["classroom"]) | Q(id__in=joined & member_ids)
+        ).select_related("teacher"),
+        "material": Material.objects.filter(
+            Q(id__in=upserts["material"]) | Q(classroom_id__in=joined & member_ids)
+        ),
+        "submission": Submission.objects.filter(
+            Q(id__in=upserts["submission"])
+            | Q(material__classroom_id__in=joined & member_ids, student=user)
+            | Q(material__classroom_id__in=joined & taught_ids)
+        ).select_related("student"),
+    }
+    data = {}
+    for model, qs in querysets.items():
+        rows = qs.filter(classroom_filter(model, member_ids))
+        data[f"{model}s"] = MODELS[model][1](rows, many=True, context=context).data
+        # upserted but no longer visible (e.g. removed without a log entry)
+        found = {str(row["id"]) for row in data[f"{model}s"]}
+        deleted.extend(
+            {"model": model, "id": object_id} for object_id in upserts[model] - found
+        )
+
+    token = entries[-1][0] if entries else since
+    return {"token": str(token), "more": more, **data, "deleted": deleted}
+
+
+def classroom_filter(model, member_ids):
+    if model == "classroom":
+        return Q(id__in=member_ids)
+    if model == "material":
+        return Q(classroom_id__in=member_ids)
+    return Q(material__classroom_id__in=member_ids)
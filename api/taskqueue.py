@@ -0,0 +1,148 @@
+"""
+Small database-backed task queue.
+
+Handlers are registered with ``@task("name")`` (see api/tasks.py) and
+enqueued with ``enqueue("name", {...})`` inside the request's transaction, so
+the job only becomes visible to workers if the request commits. Workers
+(``python manage.py run_tasks``) claim due tasks, retry failures with
+exponential backoff and give up after ``max_attempts``.
+"""
+
+import logging
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+# a claimed task not finished within this time is picked up again
+LOCK_TIMEOUT = timedelta(minutes=10)
+RETRY_BASE_SECONDS = 5
+
+
+def task(name):
+    def register(func):
+        registry[name] = func
+        return func
+
+    return register
+
+
+def enqueue(name, payload=None, key=None, delay=0, max_attempts=5):
+    """
+    Queue a task. With ``key`` the call is idempotent: if a task with that
+    key already exists (in any state) it is returned instead.
+    """
+    if name not in registry:
+        raise KeyError(f"unknown task {name!r}")
+    fields = dict(
+        name=name,
+        payload=payload or {},
+        max_attempts=max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    if key is None:
+        job = Task.objects.create(**fields)
+    else:
+        try:
+            with transaction.atomic():
+                job, _ = Task.objects.get_or_create(
+                    idempotency_key=key, defaults=fields
+                )
+        except IntegrityError:
+            # lost a race with another enqueue of the same key
+            job = Task.objects.get(idempotency_key=key)
+    if getattr(settings, "TASKS_EAGER", False) and job.status == Task.PENDING:
+        transaction.on_commit(lambda: run_now(job))
+    return job
+
+
+def claim(batch=10):
+    """Lock up to ``batch`` due tasks for this worker."""
+    now = timezone.now()
+    with transaction.atomic():
+        # its worker died: a lost run counts as an attempt
+        Task.objects.filter(
+            status=Task.RUNNING,
+            locked_until__lt=now,
+            attempts__gte=F("max_attempts"),
+        ).update(
+            status=Task.FAILED,
+            locked_until=None,
+            last_error="lock expired, worker lost",
+        )
+        due = (
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=Task.PENDING, run_at__lte=now)
+                | Q(
+                    status=Task.RUNNING,
+                    locked_until__lt=now,
+                    attempts__lt=F("max_attempts"),
+                )
+            )
+            .order_by("run_at")[:batch]
+        )
+        ids = list(due.values_list("id", flat=True))
+        Task.objects.filter(id__in=ids).update(
+            status=Task.RUNNING,
+            locked_until=now + LOCK_TIMEOUT,
+            attempts=F("attempts") + 1,
+        )
+    return list(Task.objects.filter(id__in=ids).order_by("run_at"))
+
+
+def run(job):
+    """Run one claimed task and record the outcome."""
+    try:
+        registry[job.name](**job.payload)
+    except Exception:
+        logger.exception("task %s (%s) failed", job.name, job.pk)
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Task.FAILED
+        else:
+            job.status = Task.PENDING
+            job.run_at = timezone.now() + timedelta(
+                seconds=RETRY_BASE_SECONDS * 2**job.attempts
+            )
+    else:
+        job.status = Task.DONE
+    job.locked_until = None
+    job.save(
+        update_fields=[
+            "status",
+            "attempts",
+            "run_at",
+            "locked_until",
+            "last_error",
+            "updated_at",
+        ]
+    )
+    return job.status
+
+
+def run_now(job):
+    # TASKS_EAGER: run in-process right after commit, no worker needed
+    job.attempts += 1
+    return run(job)
+
+
+def run_pending(batch=10):
+    """Claim and run one batch, return how many tasks ran."""
+    jobs = claim(batch)
+    for job in jobs:
+        run(job)
+    return len(jobs)
+
+
+def purge_finished(older_than=timedelta(days=7)):
+    cutoff = timezone.now() - older_than
+    deleted, _ = Task.objects.filter(status=Task.DONE, updated_at__lt=cutoff).delete()
+    return deleted
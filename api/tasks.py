@@ -0,0 +1,53 @@
+# background task handlers, run by `python manage.py run_tasks`
+from datetime import timedelta
+from . import deletion, notifications, provisioning, thumbnails
+from .models import Submission
+from .taskqueue import task, purge_finished
+
+
+@task("tasks.purge_finished")
+def purge_finished_tasks(days=7):
+    purge_finished(timedelta(days=days))
+
+
+@task("notifications.material_published")
+def material_published(material_id):
+    notifications.notify_material_published(material_id)
+
+
+@task("notifications.submission_graded")
+def submission_graded(submission_id):
+    notifications.notify_submission_graded(submission_id)
+
+
+@task("deletion.purge_classroom")
+def purge_classroom(classroom_id):
+    deletion.purge_classroom(classroom_id)
+
+
+@task("deletion.purge_user")
+def purge_user(user_id):
+    deletion.purge_user(user_id)
+
+
+@task("deletion.delete_files")
+def delete_files(names):
+    storage = Submission._meta.get_field("file").storage
+    for name in names:
+        storage.delete(name)
+        thumbnails.delete(name)
+
+
+@task("thumbnails.generate")
+def generate_thumbnails(name):
+    thumbnails.generate(name)
+
+
+@task("provisioning.expire")
+def expire_provision_jobs():
+    provisioning.expire_jobs()
+
+
+@task("provisioning.run")
+def provision_students(job_id):
+    provisioning.run_job(job_id)
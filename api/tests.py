@@ -1,3 +1,1099 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import uuid
+from datetime import date, timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import request_started
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from backend.warmup import warm_up
+from . import (
+    archive,
+    compression,
+    deletion,
+    framing,
+    notifications,
+    pagecache,
+    provisioning,
+    streams,
+    sync,
+    taskqueue,
+)
+from .consumers import (
+    DirectChatConsumer,
+    MaterialChatConsumer,
+    NotificationConsumer,
+    history_limit,
+)
+from .dbrouting import ReplicaRouter, reads_from_replica, sticky_key
+from .models import (
+    ChangeLog,
+    ChatArchive,
+    ChatReadMarker,
+    ClassChatMessage,
+    Classroom,
+    DirectChatMessage,
+    Enrollment,
+    Material,
+    Notification,
+    ProvisionJob,
+    Submission,
+    Task,
+)
+from .rowmappers import CLASS_CHAT_MAPPER, SUBMISSION_MAPPER
+from .serializers import ClassChatMessageSerializer, SubmissionSerializer
 
-# Create your tests here.
+User = get_user_model()
+
+
+class FramingTests(SimpleTestCase):
+    payload = {"id": 7, "message": "halo", "sender": "budi", "sender_id": 3}
+
+    def test_event_carries_one_frame(self):
+        event = framing.make_event("chat.message", self.payload)
+        self.assertEqual(set(event), {"type", "text"})
+        self.assertEqual(framing.event_payload(event), self.payload)
+
+    def test_default_encoding_forwards_sender_frame(self):
+        event = framing.make_event("chat.message", self.payload)
+        self.assertIs(framing.encode_event(event, None)[0], event["text"])
+        self.assertIs(framing.encode_event(event, framing.JSON)[0], event["text"])
+
+    def test_compact_encoding_from_frame(self):
+        event = framing.make_event("chat.message", self.payload)
+        text, binary = framing.encode_event(event, framing.COMPACT)
+        self.assertIsNone(binary)
+        self.assertEqual(framing.decode(text, None, framing.COMPACT), self.payload)
+        self.assertNotIn("_frames", event)
+
+    def test_encoded_once_per_event(self):
+        event = framing.make_event("chat.message", dict(self.payload, id=8))
+        with mock.patch("api.framing.encode", wraps=framing.encode) as encode:
+            # every local socket gets its own copy of the event
+            frames = {
+                framing.encode_event(dict(event), framing.COMPACT) for _ in range(5)
+            }
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(encode.call_count, 1)
+
+
+class RedisChannelLayerTests(SimpleTestCase):
+    """
+    group_send/receive through both redis layers of settings.CHANNEL_LAYER,
+    each sharded over two databases of the redis at REDIS_TEST_URL (skipped
+    when none is running).
+    """
+
+    url = os.environ.get("REDIS_TEST_URL", "redis://127.0.0.1:6379")
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import redis
+
+        try:
+            redis.Redis.from_url(cls.url, socket_connect_timeout=0.5).ping()
+        except redis.RedisError:
+            raise unittest.SkipTest(f"no redis at {cls.url}")
+
+    def roundtrip(self, layer):
+        async def run():
+            group = f"test_{uuid.uuid4().hex}"
+            channels = [await layer.new_channel() for _ in range(3)]
+            for channel in channels:
+                await layer.group_add(group, channel)
+            event = framing.make_event("chat.message", {"id": 1, "message": "halo"})
+            await layer.group_send(group, event)
+            received = [
+                await asyncio.wait_for(layer.receive(channel), 5)
+                for channel in channels
+            ]
+            for channel in channels:
+                await layer.group_discard(group, channel)
+            await layer.flush()
+            return received
+
+        return async_to_sync(run)()
+
+    def hosts(self):
+        return [f"{self.url}/14", f"{self.url}/15"]
+
+    def test_sharded_layer(self):
+        from channels_redis.core import RedisChannelLayer
+
+        received = self.roundtrip(RedisChannelLayer(hosts=self.hosts()))
+        self.assertEqual(len(received), 3)
+        for event in received:
+            self.assertEqual(framing.event_payload(event)["message"], "halo")
+
+    def test_pubsub_layer(self):
+        from channels_redis.pubsub import RedisPubSubChannelLayer
+
+        received = self.roundtrip(RedisPubSubChannelLayer(hosts=self.hosts()))
+        self.assertEqual(len(received), 3)
+        for event in received:
+            self.assertEqual(event["type"], "chat.message")
+            self.assertEqual(framing.event_payload(event)["message"], "halo")
+
+
+class CompressionTests(SimpleTestCase):
+    body = json.dumps([{"id": i, "title": "materi"} for i in range(200)]).encode()
+
+    def respond(self, response, accept="gzip, br"):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept)
+        return compression.CompressionMiddleware(lambda r: response)(request)
+
+    def test_negotiate(self):
+        best = "br" if compression.brotli is not None else "gzip"
+        self.assertEqual(compression.negotiate("gzip, br"), best)
+        self.assertEqual(compression.negotiate("gzip;q=1, br;q=0"), "gzip")
+        self.assertEqual(compression.negotiate("*"), best)
+        self.assertIsNone(compression.negotiate("identity"))
+        self.assertIsNone(compression.negotiate("gzip;q=0"))
+
+    def test_compresses_json(self):
+        response = self.respond(
+            HttpResponse(self.body, content_type="application/json"), "gzip"
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_passes_through(self):
+        for response in (
+            HttpResponse(b"{}", content_type="application/json"),
+            HttpResponse(self.body, content_type="text/html"),
+            StreamingHttpResponse(iter([self.body]), content_type="application/json"),
+        ):
+            self.assertFalse(self.respond(response).has_header("Content-Encoding"))
+        response = HttpResponse(self.body, content_type="application/json")
+        self.assertFalse(
+            self.respond(response, "identity").has_header("Content-Encoding")
+        )
+
+
+class KelasMixin:
+    """A teacher, a classroom with one material and an enrolled student."""
+
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create(username="guru", is_teacher=True)
+        self.student = User.objects.create(username="siswa", email="siswa@x.id")
+        self.classroom = Classroom.objects.create(teacher=self.teacher, title="IPA")
+        self.material = Material.objects.create(classroom=self.classroom, title="Sel")
+        Enrollment.objects.create(user=self.student, classroom=self.classroom)
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+
+class KelasTestCase(KelasMixin, TestCase):
+    pass
+
+
+class ChatArchiveTests(KelasTestCase):
+    def setUp(self):
+        super().setUp()
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        now = timezone.now()
+        self.old = []
+        for months_ago in (3, 2):
+            for i in range(3):
+                msg = ClassChatMessage.objects.create(
+                    material=self.material, sender=self.student, content=f"old {i}"
+                )
+                ClassChatMessage.objects.filter(id=msg.id).update(
+                    timestamp=now - timedelta(days=31 * months_ago)
+                )
+                self.old.append(msg.id)
+        with self.settings(CHAT_ARCHIVE_DIR=self.archive_dir):
+            archive.archive_before(now - timedelta(days=40), kinds=[archive.CLASS])
+        self.hot = [
+            ClassChatMessage.objects.create(
+                material=self.material, sender=self.student, content=f"new {i}"
+            ).id
+            for i in range(2)
+        ]
+
+    def ids(self, **params):
+        response = self.client.get(
+            "/api/class-chat/", {"material": str(self.material.id), **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.json()]
+
+    def test_plain_list_skips_archive(self):
+        with mock.patch("api.archive.gzip.open") as opened:
+            self.assertEqual(self.ids(), self.hot)
+        opened.assert_not_called()
+
+    @mock.patch("api.views.HISTORY_PAGE_SIZE", 4)
+    def test_before_pages_into_archive(self):
+        self.assertEqual(ChatArchive.objects.count(), 2)
+        first = self.ids(before=self.hot[-1] + 1)
+        self.assertEqual(first, self.old[-2:] + self.hot)
+        self.assertEqual(self.ids(before=first[0]), self.old[:4])
+        self.assertEqual(self.ids(before=self.old[0]), [])
+
+    def test_reads_only_the_files_the_page_needs(self):
+        with mock.patch("api.archive.gzip.open", wraps=gzip.open) as opened:
+            rows = archive.read_archived(
+                archive.CLASS, Q(thread=str(self.material.id)), self.hot[0], 2
+            )
+        self.assertEqual([row["id"] for row in rows], self.old[-2:])
+        self.assertEqual(opened.call_count, 1)
+
+    def test_direct_threads_filtered_in_sql(self):
+        for thread in ("12_3", "3_4", "31_4", "4_13"):
+            ChatArchive.objects.create(
+                kind=archive.DIRECT,
+                month=date(2020, 1, 1),
+                thread=thread,
+                path=thread,
+                first_id=1,
+                last_id=1,
+            )
+        threads = ChatArchive.objects.filter(archive.user_threads(3))
+        self.assertEqual(
+            sorted(threads.values_list("thread", flat=True)), ["12_3", "3_4"]
+        )
+
+    def test_bad_cursor(self):
+        response = self.client.get(
+            "/api/class-chat/", {"material": str(self.material.id), "before": "x"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch("api.views.HISTORY_PAGE_SIZE", 2)
+    def test_direct_history_page(self):
+        ids = [
+            DirectChatMessage.objects.create(
+                sender=self.student, recipient=self.teacher, content=str(i)
+            ).id
+            for i in range(3)
+        ]
+        response = self.client.get("/api/direct-chat/", {"before": ids[-1]})
+        self.assertEqual([row["id"] for row in response.json()], ids[:2])
+
+
+class NotificationFanOutTests(KelasTestCase):
+    def test_material_notification_is_one_group_send(self):
+        for i in range(3):
+            user = User.objects.create(username=f"murid{i}")
+            Enrollment.objects.create(user=user, classroom=self.classroom)
+        layer = mock.Mock(group_send=mock.AsyncMock())
+        with mock.patch("api.notifications.get_channel_layer", return_value=layer):
+            with self.captureOnCommitCallbacks(execute=True):
+                notifications.notify_material_published(self.material.id)
+        self.assertEqual(Notification.objects.count(), 4)
+        layer.group_send.assert_awaited_once()
+        group, event = layer.group_send.await_args.args
+        self.assertEqual(group, notifications.students_group(self.classroom.id))
+        self.assertEqual(framing.event_payload(event)["kind"], "material_published")
+
+    def test_read_with_bad_id_is_404(self):
+        self.client.force_authenticate(self.student)
+        response = self.client.post("/api/notifications/abc/read/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_student_socket_receives_classroom_push(self):
+        async def receive():
+            communicator = WebsocketCommunicator(
+                NotificationConsumer.as_asgi(), "/ws/notifications/"
+            )
+            communicator.scope["user"] = self.student
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await sync_to_async(notifications.push)(
+                notifications.students_group(self.classroom.id), {"kind": "x"}
+            )
+            frame = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return frame
+
+        self.assertEqual(async_to_sync(receive)(), {"kind": "x"})
+
+
+class ChatConsumerTests(KelasTestCase):
+    def communicator(self, consumer, path, **kwargs):
+        communicator = WebsocketCommunicator(consumer.as_asgi(), path)
+        communicator.scope["user"] = self.student
+        communicator.scope["url_route"] = {"kwargs": kwargs}
+        return communicator
+
+    def test_material_chat_saves_and_replays(self):
+        async def chat():
+            communicator = self.communicator(
+                MaterialChatConsumer, "/ws/chat/", material_id=str(self.material.id)
+            )
+            self.assertTrue((await communicator.connect())[0])
+            await communicator.send_json_to({"message": "halo"})
+            sent = await communicator.receive_json_from()
+            await communicator.disconnect()
+
+            communicator = self.communicator(
+                MaterialChatConsumer,
+                "/ws/chat/?history=5",
+                material_id=str(self.material.id),
+            )
+            self.assertTrue((await communicator.connect())[0])
+            history = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return sent, history
+
+        sent, history = async_to_sync(chat)()
+        msg = ClassChatMessage.objects.get()
+        self.assertEqual((msg.content, msg.sender_id), ("halo", self.student.id))
+        self.assertEqual(sent["id"], msg.id)
+        self.assertEqual(history, {"history": [sent]})
+
+    def test_history_limit_is_clamped(self):
+        for query, limit in (
+            (b"history=-5", 0),
+            (b"history=x", 0),
+            (b"history=500", 100),
+        ):
+            self.assertEqual(history_limit({"query_string": query}), limit)
+
+    def test_non_member_is_rejected(self):
+        async def connect():
+            communicator = self.communicator(
+                MaterialChatConsumer, "/ws/chat/", material_id=str(self.material.id)
+            )
+            communicator.scope["user"] = await sync_to_async(User.objects.create)(
+                username="tamu"
+            )
+            connected, _ = await communicator.connect()
+            return connected
+
+        self.assertFalse(async_to_sync(connect)())
+
+    def test_direct_chat_saves_message(self):
+        async def chat():
+            communicator = self.communicator(
+                DirectChatConsumer, "/ws/direct/", other_user_id=str(self.teacher.id)
+            )
+            self.assertTrue((await communicator.connect())[0])
+            for text in ("satu", "dua"):
+                await communicator.send_json_to({"message": text})
+                await communicator.receive_json_from()
+            await communicator.disconnect()
+
+        async_to_sync(chat)()
+        self.assertEqual(
+            list(
+                DirectChatMessage.objects.order_by("id").values_list(
+                    "sender_id", "recipient_id", "content"
+                )
+            ),
+            [
+                (self.student.id, self.teacher.id, "satu"),
+                (self.student.id, self.teacher.id, "dua"),
+            ],
+        )
+
+
+class GradingTests(KelasTestCase):
+    def setUp(self):
+        super().setUp()
+        self.submission = Submission.objects.create(
+            material=self.material, student=self.student, file="submissions/tugas.pdf"
+        )
+        self.url = f"/api/submissions/{self.submission.id}/"
+        self.graded = Task.objects.filter(name="notifications.submission_graded")
+
+    def test_teacher_grading_notifies(self):
+        self.client.force_authenticate(self.teacher)
+        response = self.client.patch(self.url, {"graded": True, "grade": "A"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.graded.count(), 1)
+
+    def test_regrade_to_earlier_grade_notifies(self):
+        self.client.force_authenticate(self.teacher)
+        for grade in ("A", "B", "A"):
+            self.client.patch(self.url, {"graded": True, "grade": grade})
+        self.assertEqual(self.graded.count(), 3)
+
+    def test_student_edit_does_not_notify(self):
+        self.client.patch(self.url, {"graded": True, "grade": "A+"})
+        self.assertFalse(self.graded.exists())
+
+    def test_cannot_move_to_foreign_material(self):
+        other = Classroom.objects.create(teacher=self.teacher, title="IPS")
+        foreign = Material.objects.create(classroom=other, title="Peta")
+        response = self.client.patch(self.url, {"material": str(foreign.id)})
+        self.assertEqual(response.status_code, 403)
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.material_id, self.material.id)
+
+    def test_student_cannot_grade(self):
+        response = self.client.patch(
+            self.url, {"graded": True, "grade": "A+", "message": "revisi"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.message, "revisi")
+        self.assertFalse(self.submission.graded)
+        self.assertIsNone(self.submission.grade)
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        with self.settings(MEDIA_ROOT=media):
+            response = self.client.post(
+                "/api/submissions/",
+                {
+                    "material": self.material.id,
+                    "file": SimpleUploadedFile("tugas2.pdf", b"%PDF-1.4"),
+                    "graded": True,
+                    "grade": "A",
+                },
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.json()["graded"])
+
+
+class ReadStateTests(KelasTestCase):
+    def test_bad_input_is_400(self):
+        for url, data in (
+            ("/api/class-chat/read/", {"material": "nope", "last_read_id": 1}),
+            ("/api/class-chat/read/", {"material": str(self.material.id)}),
+            (
+                "/api/class-chat/read/",
+                {"material": str(self.material.id), "last_read_id": "x"},
+            ),
+            ("/api/direct-chat/read/", {"peer": 999, "last_read_id": 1}),
+        ):
+            self.assertEqual(self.client.post(url, data).status_code, 400, data)
+        response = self.client.get("/api/class-chat/unread/", {"material": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_material_read_marker(self):
+        ids = [
+            ClassChatMessage.objects.create(
+                material=self.material, sender=self.teacher, content=str(i)
+            ).id
+            for i in range(3)
+        ]
+        material = str(self.material.id)
+        response = self.client.post(
+            "/api/class-chat/read/", {"material": material, "last_read_id": ids[0]}
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/api/class-chat/unread/", {"material": material})
+        self.assertEqual(response.json(), {material: 2})
+
+    def test_direct_unread_is_capped(self):
+        other = User.objects.create(username="teman")
+        DirectChatMessage.objects.bulk_create(
+            DirectChatMessage(sender=sender, recipient=self.student, content=str(i))
+            for sender, n in ((self.teacher, 150), (other, 1))
+            for i in range(n)
+        )
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/direct-chat/unread/")
+        self.assertEqual(
+            response.json(), {str(self.teacher.id): "99+", str(other.id): 1}
+        )
+        response = self.client.get("/api/direct-chat/unread/", {"peer": other.id})
+        self.assertEqual(response.json(), {str(other.id): 1})
+
+
+class RowMapperTests(KelasTestCase):
+    def test_matches_serializers(self):
+        ClassChatMessage.objects.create(
+            material=self.material, sender=self.student, content="halo"
+        )
+        Submission.objects.create(
+            material=self.material, student=self.student, file="submissions/a.pdf"
+        )
+        Submission.objects.create(
+            material=self.material,
+            student=self.student,
+            file="submissions/b.jpg",
+            thumbnails_ready=True,
+        )
+        for mapper, serializer_class in (
+            (CLASS_CHAT_MAPPER, ClassChatMessageSerializer),
+            (SUBMISSION_MAPPER, SubmissionSerializer),
+        ):
+            qs = serializer_class.Meta.model.objects.all()
+            expected = json.loads(
+                json.dumps(serializer_class(qs, many=True).data, cls=DjangoJSONEncoder)
+            )
+            self.assertEqual(mapper.rows(qs), expected)
+
+
+class ThumbnailTests(KelasTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.teacher)
+
+    def add_images(self, n, ready=False):
+        Submission.objects.bulk_create(
+            Submission(
+                material=self.material,
+                student=self.student,
+                file=f"submissions/foto{i}.jpg",
+                thumbnails_ready=ready,
+            )
+            for i in range(n)
+        )
+
+    def list_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/submissions/", params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        self.add_images(2)
+        few = self.list_queries(), self.list_queries(fields="id,thumbnails")
+        self.add_images(20)
+        many = self.list_queries(), self.list_queries(fields="id,thumbnails")
+        self.assertEqual(few, many)
+        # reads never queue generation
+        self.assertFalse(Task.objects.filter(name="thumbnails.generate").exists())
+
+    def test_urls_once_ready(self):
+        self.add_images(1, ready=True)
+        self.add_images(1)
+        rows = self.client.get("/api/submissions/").json()
+        ready = [row["thumbnails"] for row in rows if row["thumbnails"]]
+        self.assertEqual(len(ready), 1)
+        self.assertTrue(ready[0]["160"].endswith(".jpg.160.webp"))
+
+
+class WarmUpTests(SimpleTestCase):
+    @override_settings(WARMUP=True)
+    def test_connects_on_first_request_only(self):
+        self.addCleanup(request_started.disconnect, dispatch_uid="warmup")
+        db = mock.Mock(pool=None)
+        with mock.patch("backend.warmup.connections", {"default": db}):
+            warm_up()
+            # nothing opened at import time (gunicorn --preload master)
+            db.ensure_connection.assert_not_called()
+            request_started.send(sender=None)
+            request_started.send(sender=None)
+        db.ensure_connection.assert_called_once()
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """replica0: a second alias on the test database, added for these tests."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # connections.settings is settings.DATABASES
+        replica = {**connections["default"].settings_dict}
+        replica["TEST"] = {**replica["TEST"], "MIRROR": "default"}
+        cls.enterClassContext(mock.patch.dict(settings.DATABASES, replica0=replica))
+        # the runner only knows configured aliases, allow this one from here on
+        cls.databases = {"default", "replica0"}
+        cls.addClassCleanup(connections["replica0"].close)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="siswa")
+        Notification.objects.create(user=self.user, kind="x", title="halo")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def queries(self, method, url):
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections["replica0"]) as replica:
+                response = getattr(self.client, method)(url)
+        self.assertLess(response.status_code, 400)
+        return len(primary), len(replica)
+
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(User), "default")
+        with reads_from_replica():
+            self.assertEqual(router.db_for_read(User), "replica0")
+            self.assertEqual(router.db_for_write(User), "default")
+        self.assertTrue(router.allow_migrate("default", "api"))
+        self.assertFalse(router.allow_migrate("replica0", "api"))
+
+    def test_safe_requests_read_from_replica(self):
+        primary, replica = self.queries("get", "/api/notifications/")
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_reads_stick_to_primary_after_write(self):
+        primary, replica = self.queries("post", "/api/notifications/read_all/")
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+        primary, replica = self.queries("get", "/api/notifications/")
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+        cache.delete(sticky_key(self.user.id))
+        primary, replica = self.queries("get", "/api/notifications/")
+        self.assertEqual(primary, 0)
+
+
+class PageCacheTests(KelasTestCase):
+    def titles(self):
+        response = self.client.get(
+            "/api/materials/", {"classroom": str(self.classroom.id)}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [m["title"] for m in response.json()]
+
+    def test_served_from_cache_until_bumped(self):
+        self.assertEqual(self.titles(), ["Sel"])
+        # a write without signals isn't seen until the page is bumped
+        Material.objects.filter(pk=self.material.pk).update(title="Sel hewan")
+        with self.assertNumQueries(1):  # membership only
+            self.assertEqual(self.titles(), ["Sel"])
+        with self.captureOnCommitCallbacks(execute=True):
+            pagecache.bump(f"classroom:{self.classroom.id}")
+        self.assertEqual(self.titles(), ["Sel hewan"])
+
+    def test_saves_bump_the_page(self):
+        self.titles()
+        with self.captureOnCommitCallbacks(execute=True):
+            Material.objects.create(classroom=self.classroom, title="Organ")
+        self.assertEqual(sorted(self.titles()), ["Organ", "Sel"])
+
+    def test_compressed_variant(self):
+        for i in range(30):
+            Material.objects.create(classroom=self.classroom, title=f"Bab {i}" * 5)
+        url = f"/api/materials/?classroom={self.classroom.id}"
+        plain = self.client.get(url).content
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain)
+
+
+class PurgeTests(KelasTestCase):
+    def setUp(self):
+        super().setUp()
+        other = User.objects.create(username="teman")
+        Submission.objects.create(
+            material=self.material, student=self.student, file="submissions/tugas.pdf"
+        )
+        ClassChatMessage.objects.create(
+            material=self.material, sender=self.student, content="halo"
+        )
+        DirectChatMessage.objects.create(
+            sender=self.teacher, recipient=self.student, content="halo"
+        )
+        DirectChatMessage.objects.create(
+            sender=self.student, recipient=other, content="hai"
+        )
+        ChatReadMarker.objects.create(user=self.student, material=self.material)
+        ChatReadMarker.objects.create(user=self.student, peer=self.teacher)
+        Notification.objects.create(user=self.student, kind="x", title="x")
+        ProvisionJob.objects.create(requested_by=self.teacher, classroom=self.classroom)
+
+    def run_tasks(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pass
+        while taskqueue.run_pending():
+            pass
+        self.assertFalse(Task.objects.exclude(status=Task.DONE).exists())
+        connection.check_constraints()
+
+    def referencing(self, ids):
+        """{model: rows} pointing at the given classroom/material/user ids."""
+        found = {}
+        for model in apps.get_app_config("api").get_models():
+            for field in model._meta.concrete_fields:
+                target = field.related_model
+                if field.many_to_one and target in ids:
+                    rows = model._base_manager.filter(
+                        **{f"{field.attname}__in": ids[target]}
+                    ).count()
+                    found[model] = found.get(model, 0) + rows
+        return found
+
+    def test_fixture_covers_every_reference(self):
+        refs = self.referencing(
+            {
+                Classroom: [self.classroom.pk],
+                Material: [self.material.pk],
+                User: [self.teacher.pk, self.student.pk],
+            }
+        )
+        self.assertTrue(refs)
+        self.assertEqual([m for m, rows in refs.items() if not rows], [])
+
+    def test_purge_classroom(self):
+        deletion.delete_classroom(self.classroom)
+        self.run_tasks()
+        self.assertFalse(Classroom.all_objects.exists())
+        refs = self.referencing(
+            {Classroom: [self.classroom.pk], Material: [self.material.pk]}
+        )
+        self.assertEqual({m: rows for m, rows in refs.items() if rows}, {})
+
+    def test_purge_user(self):
+        deletion.delete_user(self.teacher)
+        self.run_tasks()
+        self.assertFalse(User.all_objects.filter(pk=self.teacher.pk).exists())
+        refs = self.referencing(
+            {
+                Classroom: [self.classroom.pk],
+                Material: [self.material.pk],
+                User: [self.teacher.pk],
+            }
+        )
+        self.assertEqual({m: rows for m, rows in refs.items() if rows}, {})
+
+
+class SoftDeleteTests(KelasTestCase):
+    def test_deleted_classroom_is_hidden_until_purged(self):
+        self.client.force_authenticate(self.teacher)
+        response = self.client.delete(f"/api/classrooms/{self.classroom.id}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Classroom.objects.exists())
+        self.assertIsNotNone(Classroom.all_objects.get().deleted_at)
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get("/api/classrooms/").json(), [])
+        self.assertTrue(
+            ChangeLog.objects.filter(
+                model="enrollment", op=ChangeLog.DELETE, user_id=self.student.id
+            ).exists()
+        )
+        self.assertTrue(Task.objects.filter(name="deletion.purge_classroom").exists())
+        # nothing is removed before the purge runs
+        self.assertTrue(Material.objects.filter(pk=self.material.pk).exists())
+
+    def test_deleted_user_is_hidden_and_inactive(self):
+        deletion.delete_user(self.student)
+        self.assertFalse(User.objects.filter(pk=self.student.pk).exists())
+        self.assertFalse(User.all_objects.get(pk=self.student.pk).is_active)
+        self.assertTrue(Task.objects.filter(name="deletion.purge_user").exists())
+
+    @mock.patch("api.deletion.BATCH_SIZE", 2)
+    def test_purge_deletes_in_batches(self):
+        ClassChatMessage.objects.bulk_create(
+            ClassChatMessage(material=self.material, sender=self.student, content="x")
+            for _ in range(5)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            deleted = deletion.delete_in_batches(ClassChatMessage.objects.all())
+        self.assertEqual(deleted, 5)
+        deletes = [q for q in queries if q["sql"].startswith("DELETE")]
+        self.assertEqual(len(deletes), 3)
+        self.assertFalse(ClassChatMessage.objects.exists())
+
+    def test_purge_removes_chat_archives(self):
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        other = User.objects.create(username="teman")
+        ClassChatMessage.objects.create(
+            material=self.material, sender=self.student, content="lama"
+        )
+        for sender, recipient in ((self.teacher, self.student), (self.student, other)):
+            DirectChatMessage.objects.create(
+                sender=sender, recipient=recipient, content="lama"
+            )
+        old = timezone.now() - timedelta(days=100)
+        ClassChatMessage.objects.update(timestamp=old)
+        DirectChatMessage.objects.update(timestamp=old)
+        with self.settings(CHAT_ARCHIVE_DIR=archive_dir):
+            archive.archive_before(timezone.now() - timedelta(days=40))
+        self.assertEqual(ChatArchive.objects.count(), 3)
+        kept = ChatArchive.objects.get(
+            thread=archive.direct_thread(self.student.id, other.id)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            deletion.purge_user(self.teacher.id)
+        self.assertEqual(list(ChatArchive.objects.all()), [kept])
+        remaining = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(archive_dir)
+            for name in names
+        ]
+        self.assertEqual(remaining, [kept.path])
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        handlers = {"test.ok": self.calls.append, "test.fail": self.fail_task}
+        patcher = mock.patch.dict(
+            taskqueue.registry, {name: self.wrap(f) for name, f in handlers.items()}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def wrap(self, func):
+        return lambda **payload: func(payload)
+
+    def fail_task(self, payload):
+        raise RuntimeError("boom")
+
+    def test_retries_with_backoff_then_gives_up(self):
+        job = taskqueue.enqueue("test.fail", max_attempts=2)
+        with self.assertLogs("api.taskqueue", "ERROR"):
+            self.assertEqual(taskqueue.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Task.PENDING, 1))
+        delay = (job.run_at - timezone.now()).total_seconds()
+        self.assertAlmostEqual(delay, taskqueue.RETRY_BASE_SECONDS * 2, delta=2)
+        self.assertIn("boom", job.last_error)
+        # not due yet
+        self.assertEqual(taskqueue.run_pending(), 0)
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs("api.taskqueue", "ERROR"):
+            taskqueue.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Task.FAILED, 2))
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(taskqueue.run_pending(), 0)
+
+    def test_idempotency_key(self):
+        first = taskqueue.enqueue("test.ok", {"n": 1}, key="k")
+        second = taskqueue.enqueue("test.ok", {"n": 2}, key="k")
+        self.assertEqual(first.pk, second.pk)
+        taskqueue.run_pending()
+        self.assertEqual(self.calls, [{"n": 1}])
+        # also once done
+        taskqueue.enqueue("test.ok", {"n": 3}, key="k")
+        self.assertEqual(taskqueue.run_pending(), 0)
+
+    def test_eager_runs_after_commit(self):
+        with self.settings(TASKS_EAGER=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                job = taskqueue.enqueue("test.ok", {"n": 1})
+                self.assertEqual(self.calls, [])
+        self.assertEqual(self.calls, [{"n": 1}])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Task.DONE, 1))
+
+    def test_lost_worker(self):
+        expired = timezone.now() - timedelta(seconds=1)
+        retry = taskqueue.enqueue("test.ok", {"n": 1}, max_attempts=2)
+        once = taskqueue.enqueue("test.ok", {"n": 2}, max_attempts=1)
+        Task.objects.update(status=Task.RUNNING, attempts=1, locked_until=expired)
+        self.assertEqual(taskqueue.run_pending(), 1)
+        self.assertEqual(self.calls, [{"n": 1}])
+        retry.refresh_from_db()
+        once.refresh_from_db()
+        self.assertEqual((retry.status, retry.attempts), (Task.DONE, 2))
+        self.assertEqual(once.status, Task.FAILED)
+        self.assertIn("worker lost", once.last_error)
+
+
+class ClassroomCloneTests(KelasTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.teacher)
+        self.url = f"/api/classrooms/{self.classroom.id}/clone/"
+
+    def test_clone(self):
+        response = self.client.post(
+            self.url, {"title": "IPA 2027", "copy_enrollments": True}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        copy = Classroom.objects.get(pk=response.json()["id"])
+        self.assertEqual(copy.title, "IPA 2027")
+        self.assertEqual(list(copy.materials.values_list("title", flat=True)), ["Sel"])
+        self.assertTrue(copy.enrollments.filter(user=self.student).exists())
+
+    def test_invalid_title_is_400(self):
+        response = self.client.post(self.url, {"title": "x" * 1000}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("title", response.json())
+        self.assertEqual(Classroom.objects.count(), 1)
+
+
+class BulkProvisionTests(KelasTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.teacher)
+
+    def test_job_records_failed_rows(self):
+        rows = [
+            {"username": "ani", "password": "rahasia1"},
+            {"username": "siswa", "password": "rahasia2"},
+            {"username": "ani", "password": "rahasia3"},
+            {"username": "", "password": "rahasia4"},
+            {"username": "bad name/<x>", "password": "rahasia5"},
+            {"username": "budi", "password": "rahasia6", "email": "not-an-email"},
+            {"username": "x" * 300, "password": "rahasia7"},
+        ]
+        response = self.client.post(
+            "/api/users/bulk/",
+            {"students": rows, "classroom": self.classroom.id},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], Task.PENDING)
+        self.assertFalse(User.objects.filter(username="ani").exists())
+
+        taskqueue.run_pending()
+        job = self.client.get(response["Location"]).json()
+        self.assertEqual(job["status"], Task.DONE)
+        self.assertEqual((job["created"], job["failed"]), (1, 6))
+        self.assertEqual([e["row"] for e in job["errors"]], [2, 3, 4, 5, 6, 7])
+        self.assertTrue(job["errors"][4]["detail"].startswith("email:"))
+        ani = User.objects.get(username="ani")
+        self.assertTrue(ani.check_password("rahasia1"))
+        self.assertTrue(ani.enrollments.filter(classroom=self.classroom).exists())
+        self.assertEqual(ProvisionJob.objects.get().rows, [])
+
+    def test_bad_request(self):
+        for data in (
+            {"students": "x"},
+            {"students": [1]},
+            {"students": [], "classroom": "nope"},
+            {"students": [], "classroom": "7c9f9b52-1111-4d2a-9a55-0123456789ab"},
+        ):
+            response = self.client.post("/api/users/bulk/", data, format="json")
+            self.assertEqual(response.status_code, 400, data)
+        self.assertFalse(ProvisionJob.objects.exists())
+
+    def test_unstarted_job_expires(self):
+        response = self.client.post(
+            "/api/users/bulk/",
+            {"students": [{"username": "ani", "password": "rahasia"}]},
+            format="json",
+        )
+        job = ProvisionJob.objects.get()
+        self.assertEqual(job.rows[0]["password"], "rahasia")
+        self.assertEqual(provisioning.expire_jobs(), 0)
+        ProvisionJob.objects.update(
+            created_at=timezone.now() - provisioning.JOB_TTL - timedelta(minutes=1)
+        )
+        taskqueue.run_pending()
+        job = self.client.get(response["Location"]).json()
+        self.assertEqual(job["status"], Task.FAILED)
+        self.assertEqual(ProvisionJob.objects.get().rows, [])
+        self.assertFalse(User.objects.filter(username="ani").exists())
+
+    def test_username_taken_after_validation(self):
+        students = [
+            {"row": 1, "username": "siswa", "password": "x", "email": ""},
+            {"row": 2, "username": "budi", "password": "y", "email": ""},
+        ]
+        step = list(provisioning.provision(students))[-1]
+        self.assertEqual(step["created"], 1)
+        self.assertEqual(
+            step["errors"], [{"row": 1, "detail": "username siswa already exists"}]
+        )
+        self.assertTrue(User.objects.filter(username="budi").exists())
+
+    def test_job_visible_to_requester_only(self):
+        job = ProvisionJob.objects.create(requested_by=self.teacher)
+        other = User.objects.create(username="guru2", is_teacher=True)
+        self.client.force_authenticate(other)
+        response = self.client.get(f"/api/users/bulk/{job.id}/")
+        self.assertEqual(response.status_code, 404)
+
+
+class UserSearchTests(KelasTestCase):
+    def setUp(self):
+        super().setUp()
+        budi = User.objects.create(username="Budi", email="Budi.S@Sekolah.ID")
+        Enrollment.objects.create(user=budi, classroom=self.classroom)
+
+    def search(self, q):
+        response = self.client.get("/api/users/search/", {"q": q})
+        return [user["username"] for user in response.json()]
+
+    def test_case_insensitive(self):
+        self.assertEqual(self.search("bu"), ["Budi"])
+        self.assertEqual(self.search("BU"), ["Budi"])
+        self.assertEqual(self.search("budi.s@sek"), ["Budi"])
+        self.assertEqual(self.search("GU"), ["guru"])
+
+    def test_sqlite_prefix_range_uses_index(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("sqlite plan")
+        with CaptureQueriesContext(connection) as queries:
+            self.search("bu")
+        sql = next(q["sql"] for q in queries if "LOWER" in q["sql"])
+        self.assertNotIn("LIKE", sql)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM api_user "
+                "WHERE lower(username) >= 'bu' AND lower(username) < 'bu\uffff'"
+            )
+            plan = " ".join(str(row) for row in cursor.fetchall())
+        self.assertIn("api_user_username_lower", plan)
+
+    def test_cache_key_uses_normalized_query(self):
+        self.assertEqual(self.search("Bu"), ["Budi"])
+        with self.assertNumQueries(1):  # membership only
+            self.assertEqual(self.search(" bU "), ["Budi"])
+
+
+class SyncTests(KelasMixin, TransactionTestCase):
+    # autocommit: on_commit numbering runs like in production
+
+    def sync(self, since):
+        response = self.client.get("/api/sync/", {"since": since})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return data["token"], {m["title"] for m in data["materials"]}
+
+    def test_delayed_commit_is_delivered(self):
+        token, _ = self.sync(0)
+        # a slow transaction logs its change first (lower id) but commits
+        # last; until then its row is invisible to everyone else
+        with mock.patch("api.sync.sequence_after_commit"):
+            slow = Material.objects.create(classroom=self.classroom, title="slow")
+        slow_entry = ChangeLog.objects.get(object_id=str(slow.id))
+        slow_id = slow_entry.id
+        slow_entry.delete()
+        Material.objects.create(classroom=self.classroom, title="fast")
+        token, titles = self.sync(token)
+        self.assertEqual(titles, {"fast"})
+        # the slow transaction commits, then its numbering runs
+        slow_entry.id = slow_id
+        slow_entry.save(force_insert=True)
+        sync.assign_sequence()
+        self.assertLess(slow_id, ChangeLog.objects.get(seq=int(token)).id)
+        token, titles = self.sync(token)
+        self.assertEqual(titles, {"slow"})
+        self.assertEqual(self.sync(token)[1], set())
+
+    def test_one_numbering_per_transaction(self):
+        with transaction.atomic():
+            for i in range(3):
+                Material.objects.create(classroom=self.classroom, title=str(i))
+            pending = [
+                func
+                for _, func, _ in connection.run_on_commit
+                if func is sync.assign_sequence
+            ]
+            self.assertEqual(len(pending), 1)
+        self.assertFalse(ChangeLog.objects.filter(seq__isnull=True).exists())
+
+
+class StreamReceiveTests(SimpleTestCase):
+    def test_timeout_keeps_the_receive(self):
+        async def run():
+            arrived = asyncio.get_running_loop().create_future()
+            layer = mock.Mock(receive=mock.Mock(return_value=arrived))
+            event, receiving = await streams.next_event(layer, "c", None, 0.01)
+            self.assertIsNone(event)
+            self.assertFalse(receiving.cancelled())
+            arrived.set_result({"text": "{}"})
+            event, receiving = await streams.next_event(layer, "c", receiving, 1)
+            self.assertEqual(event, {"text": "{}"})
+            self.assertIsNone(receiving)
+            layer.receive.assert_called_once_with("c")
+
+        asyncio.run(run())
@@ -0,0 +1,112 @@
+"""
+WebP thumbnails for image submissions.
+
+Each image gets one thumbnail per size bucket, stored next to the original
+as ``<name>.<size>.webp``. They are made by the ``thumbnails.generate`` task,
+queued when a file is uploaded (never in a request), which then sets
+``Submission.thumbnails_ready``. Urls are built from that flag, so rendering
+a list touches neither the storage nor the cache. JPEGs are decoded with
+Pillow's draft mode, which scales down while decoding instead of loading the
+full-size photo.
+"""
+
+import os
+from io import BytesIO
+from PIL import Image, ImageOps, UnidentifiedImageError
+from django.core.files.base import ContentFile
+from .models import Submission
+from .taskqueue import enqueue
+
+# longest side in px, largest first
+SIZES = (480, 160)
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"}
+QUALITY = 80
+BACKFILL_BATCH = 500
+
+
+def storage():
+    return Submission._meta.get_field("file").storage
+
+
+def is_image(name):
+    return bool(name) and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def thumbnail_name(name, size):
+    return f"{name}.{size}.webp"
+
+
+def schedule(name):
+    """Queue generation for an uploaded file (no-op for non-images)."""
+    if is_image(name):
+        enqueue("thumbnails.generate", {"name": name}, key=f"thumbnails:{name}")
+
+
+def urls(name, ready):
+    """{size: url} once the thumbnails exist (``thumbnails_ready``), else None."""
+    if not ready or not is_image(name):
+        return None
+    store = storage()
+    return {str(size): store.url(thumbnail_name(name, size)) for size in SIZES}
+
+
+def absolute_urls(name, ready, request):
+    thumbs = urls(name, ready)
+    if thumbs is None or request is None:
+        return thumbs
+    return {size: request.build_absolute_uri(url) for size, url in thumbs.items()}
+
+
+def generate(name):
+    store = storage()
+    try:
+        with store.open(name, "rb") as f:
+            image = Image.open(f)
+            # JPEG: decode straight to the smallest scale >= the largest bucket
+            image.draft("RGB", (SIZES[0], SIZES[0]))
+            image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        # not a usable image, don't retry
+        return
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    for size in SIZES:
+        # each bucket is scaled from the previous, larger one
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, "WEBP", quality=QUALITY, method=4)
+        thumb = thumbnail_name(name, size)
+        store.delete(thumb)  # keep the name, storages rename on conflict
+        store.save(thumb, ContentFile(buffer.getvalue()))
+    Submission.objects.filter(file=name).update(thumbnails_ready=True)
+
+
+def delete(name):
+    store = storage()
+    for size in SIZES:
+        store.delete(thumbnail_name(name, size))
+
+
+def backfill():
+    """
+    Flag submissions uploaded before ``thumbnails_ready`` existed whose
+    thumbnails are already stored, queue the others. Returns (ready, queued).
+    """
+    store = storage()
+    ready, queued = [], 0
+    pending = Submission.objects.filter(thumbnails_ready=False).values_list(
+        "id", "file"
+    )
+    for pk, name in pending.iterator(chunk_size=BACKFILL_BATCH):
+        if not is_image(name):
+            continue
+        if store.exists(thumbnail_name(name, SIZES[-1])):
+            ready.append(pk)
+        else:
+            schedule(name)
+            queued += 1
+    for start in range(0, len(ready), BACKFILL_BATCH):
+        Submission.objects.filter(id__in=ready[start : start + BACKFILL_BATCH]).update(
+            thumbnails_ready=True
+        )
+    return len(ready), queued
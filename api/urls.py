@@ -6,8 +6,14 @@ from .views import (
     SubmissionViewSet,
     ClassChatMessageViewSet,
     DirectChatViewSet,
+    NotificationViewSet,
     RegisterView,
+    SyncView,
+    BulkProvisionView,
+    ProvisionJobView,
+    UserSearchView,
 )
+from . import streams
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 router = DefaultRouter()
@@ -16,10 +22,33 @@ router.register("materials", MaterialViewSet, basename="material")
 router.register("submissions", SubmissionViewSet, basename="submission")
 router.register("class-chat", ClassChatMessageViewSet, basename="classchat")
 router.register("direct-chat", DirectChatViewSet, basename="directchat")
+router.register("notifications", NotificationViewSet, basename="notification")
 
 urlpatterns = [
     path("", include(router.urls)),
     path("auth/register/", RegisterView.as_view(), name="register"),
+    path("users/bulk/", BulkProvisionView.as_view(), name="user_bulk"),
+    path(
+        "users/bulk/<uuid:job_id>/",
+        ProvisionJobView.as_view(),
+        name="user_bulk_job",
+    ),
+    path("users/search/", UserSearchView.as_view(), name="user_search"),
+    path("sync/", SyncView.as_view(), name="sync"),
+    path(
+        "stream/material/<uuid:material_id>/",
+        streams.material_stream,
+        name="material_stream",
+    ),
+    path(
+        "stream/direct/<int:other_user_id>/",
+        streams.direct_stream,
+        name="direct_stream",
+    ),
+    path(
+        "poll/material/<uuid:material_id>/", streams.material_poll, name="material_poll"
+    ),
+    path("poll/direct/<int:other_user_id>/", streams.direct_poll, name="direct_poll"),
     path("auth/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("auth/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
 ]
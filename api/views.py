@@ -1,8 +1,13 @@
-from rest_framework import viewsets, mixins, status
+from rest_framework import viewsets, mixins, status, permissions, serializers
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.pagination import CursorPagination
+from rest_framework.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404
+from django.db.models import Q
+from django.utils import timezone
 from .models import (
     Classroom,
     Material,
@@ -10,22 +15,52 @@ from .models import (
     Submission,
     ClassChatMessage,
     DirectChatMessage,
+    Notification,
+    ProvisionJob,
 )
 from .serializers import (
     ClassroomSerializer,
+    ClassroomCloneSerializer,
+    BulkProvisionSerializer,
     MaterialSerializer,
     EnrollmentSerializer,
     SubmissionSerializer,
     ClassChatMessageSerializer,
     DirectChatMessageSerializer,
+    NotificationSerializer,
     RegisterSerializer,
     UserSerializer,
+    ClassChatReadSerializer,
+    DirectChatReadSerializer,
+    ProvisionJobSerializer,
+)
+from .permissions import IsTeacher, IsTeacherOrReadOnly, IsClassroomMember
+from .membership import get_membership
+from .deletion import delete_classroom
+from .cloning import clone_classroom
+from . import thumbnails
+from .pagecache import cached_list
+from .archive import archived_class_messages, archived_direct_messages
+from .taskqueue import enqueue
+from .readstate import mark_read, material_unread, direct_unread
+from .rowmappers import CLASS_CHAT_MAPPER, SUBMISSION_MAPPER
+from .search import search_users
+from .provisioning import MAX_ROWS
+from .sync import changes_since, parse_token
+from .dbrouting import (
+    mark_write,
+    replica_allowed,
+    reset_read_routing,
+    route_reads_to_replica,
 )
-from .permissions import IsTeacher, IsTeacherOrReadOnly
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+HISTORY_PAGE_SIZE = 100
+# threads per unread-count request
+UNREAD_IDS = 100
+
 # register endpoint
 from rest_framework.views import APIView
 
@@ -40,16 +75,224 @@ class RegisterView(APIView):
         return Response(UserSerializer(user).data, status=201)
 
 
+class ReplicaReadMixin:
+    """
+    Send safe requests to a read replica unless the user wrote recently;
+    successful writes make the user's reads stick to the primary.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in permissions.SAFE_METHODS and replica_allowed(
+            request.user.id
+        ):
+            self._replica_token = route_reads_to_replica()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, "_replica_token", None)
+        if token is not None:
+            reset_read_routing(token)
+            self._replica_token = None
+        elif (
+            request.method not in permissions.SAFE_METHODS
+            and response.status_code < 400
+            and request.user.is_authenticated
+        ):
+            mark_write(request.user.id)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class SparseFieldsMixin:
+    """Trim list/detail querysets to the serializer's ?fields/?expand."""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        if self.request.method in permissions.SAFE_METHODS and hasattr(
+            serializer_class, "optimize_queryset"
+        ):
+            queryset = serializer_class.optimize_queryset(queryset, self.request)
+        return queryset
+
+
+class FastListMixin:
+    """
+    Render plain list requests with a prebuilt RowMapper over .values()
+    instead of the serializer. ?fields/?expand requests use the serializer.
+    """
+
+    list_mapper = None
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        if self.list_mapper is None or "fields" in params or "expand" in params:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.list_mapper.rows(page, request))
+        return Response(self.list_mapper.rows(queryset, request))
+
+
+def id_list(request, name, field):
+    """?name=a,b validated with ``field``, at most UNREAD_IDS ids (400 otherwise)."""
+    values = [v for v in request.query_params.get(name, "").split(",") if v]
+    return serializers.ListField(child=field, max_length=UNREAD_IDS).run_validation(
+        values
+    )
+
+
+class ChatHistoryMixin:
+    """
+    ``?before=<id>`` pages back through chat history, HISTORY_PAGE_SIZE
+    messages at a time. A page the table can't fill is topped up from the
+    chat archive (``archived_rows``); the plain list never reads the archive.
+    """
+
+    def history_cursor(self):
+        before = self.request.query_params.get("before")
+        if before is None:
+            return None
+        return serializers.IntegerField(min_value=1).run_validation(before)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        before = self.history_cursor() if self.action == "list" else None
+        if before is not None:
+            queryset = queryset.filter(id__lt=before)
+            # lowest id of the page, one indexed lookup instead of a subquery
+            floor = (
+                queryset.order_by("-id")
+                .values_list("id", flat=True)[HISTORY_PAGE_SIZE - 1 :]
+                .first()
+            )
+            if floor is not None:
+                queryset = queryset.filter(id__gte=floor)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        before = self.history_cursor()
+        missing = HISTORY_PAGE_SIZE - len(response.data)
+        if before is not None and missing > 0:
+            # older months live in the chat archive, they come first
+            archived = self.archived_rows(request, before, missing)
+            if archived:
+                rows = self.get_serializer_class().trim_rows(archived, request)
+                response.data = rows + response.data
+        return response
+
+    def archived_rows(self, request, before, limit):
+        return []
+
+
+class UserSearchView(APIView):
+    """Autocomplete DM recipients: ?q=<username or email prefix>"""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(
+            search_users(
+                request.user,
+                request.query_params.get("q", ""),
+                get_membership(request),
+            )
+        )
+
+
+class BulkProvisionView(APIView):
+    """
+    Create student accounts in bulk:
+    {"students": [{"username", "password", "email"}], "classroom": <id>}
+    With "classroom" the students are enrolled too. The accounts are created
+    by a background task: the answer is 202 with the job, poll
+    GET /api/users/bulk/<id>/ (the Location header) for progress and for the
+    rows that could not be created.
+    """
+
+    permission_classes = [IsAuthenticated, IsTeacher]
+
+    def post(self, request):
+        serializer = BulkProvisionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        rows = serializer.validated_data["students"]
+        if len(rows) > MAX_ROWS:
+            raise serializers.ValidationError(
+                {"students": [f"at most {MAX_ROWS} rows per batch"]}
+            )
+        classroom = serializer.validated_data.get("classroom")
+        if classroom is not None and not get_membership(request).teaches(classroom.id):
+            raise PermissionDenied("only classroom teacher can enroll students")
+        job = ProvisionJob.objects.create(
+            requested_by=request.user,
+            classroom=classroom,
+            rows=[
+                {key: row.get(key) for key in ("username", "password", "email")}
+                for row in rows
+            ],
+            total=len(rows),
+        )
+        # a retry would report the rows created by the first run as taken
+        enqueue(
+            "provisioning.run",
+            {"job_id": str(job.pk)},
+            key=f"provisioning:{job.pk}",
+            max_attempts=1,
+        )
+        return Response(
+            ProvisionJobSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={
+                "Location": reverse("user_bulk_job", args=[job.pk], request=request)
+            },
+        )
+
+
+class ProvisionJobView(APIView):
+    """Progress of a bulk provisioning job, for the teacher who started it."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(ProvisionJob, pk=job_id, requested_by=request.user)
+        return Response(ProvisionJobSerializer(job).data)
+
+
+class SyncView(APIView):
+    """
+    Changes in the user's classrooms since ?since=<token>. Keep the returned
+    token for the next call; "more": true means call again right away.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        since = parse_token(request.query_params.get("since"))
+        return Response(changes_since(request.user, since, request))
+
+
 # classroom viewset
-class ClassroomViewSet(viewsets.ModelViewSet):
+class ClassroomViewSet(ReplicaReadMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Classroom.objects.all()
     serializer_class = ClassroomSerializer
-    permission_classes = [IsAuthenticated, IsTeacherOrReadOnly]
+    permission_classes = [IsAuthenticated, IsTeacherOrReadOnly, IsClassroomMember]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action == "join":
+            # joining is how non-members get in
+            return qs
+        return qs.filter(id__in=get_membership(self.request).member_ids)
 
     def perform_create(self, serializer):
-        # only teacher can create 
+        # only teacher can create
         serializer.save(teacher=self.request.user)
 
+    def perform_destroy(self, instance):
+        # hidden right away, rows are purged in the background
+        delete_classroom(instance)
+
     @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated])
     def join(self, request, pk=None):
         """
@@ -79,43 +322,124 @@ class ClassroomViewSet(viewsets.ModelViewSet):
         )
 
     @action(
-        detail=True, methods=["post"], permission_classes=[IsAuthenticated, IsTeacher]
+        detail=True,
+        methods=["post"],
+        permission_classes=[IsAuthenticated, IsTeacher, IsClassroomMember],
     )
     def regenerate_token(self, request, pk=None):
         classroom = self.get_object()
-        if classroom.teacher != request.user:
-            return Response({"detail": "not allowed"}, status=403)
         classroom.regenerate_token()
         return Response({"join_token": classroom.join_token})
 
+    @action(
+        detail=True,
+        methods=["post"],
+        permission_classes=[IsAuthenticated, IsTeacher, IsClassroomMember],
+    )
+    def clone(self, request, pk=None):
+        """
+        Copy the classroom and its materials for a new term, with a new
+        join token: {"title": "...", "copy_enrollments": false}
+        """
+        source = self.get_object()
+        options = ClassroomCloneSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+        copy = clone_classroom(source, **options.validated_data)
+        return Response(self.get_serializer(copy).data, status=status.HTTP_201_CREATED)
+
 
-class MaterialViewSet(viewsets.ModelViewSet):
+class MaterialViewSet(ReplicaReadMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Material.objects.all()
     serializer_class = MaterialSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsClassroomMember]
 
     def get_queryset(self):
-        qs = super().get_queryset()
+        qs = (
+            super()
+            .get_queryset()
+            .filter(classroom_id__in=get_membership(self.request).member_ids)
+        )
         classroom_id = self.request.query_params.get("classroom")
         if classroom_id:
             qs = qs.filter(classroom_id=classroom_id)
         return qs
 
+    def page_scope(self, request):
+        # one classroom's materials are the same for all its members
+        classroom_id = request.query_params.get("classroom")
+        if classroom_id and get_membership(request).is_member(classroom_id):
+            return f"classroom:{classroom_id}"
+        return None
+
+    @cached_list
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         # ensure only teacher who owns classroom can create material
-        classroom = serializer.validated_data.get("classroom")
-        if classroom.teacher != self.request.user:
-            raise PermissionError("only classroom teacher can add material")
+        self.check_teaches(serializer.validated_data["classroom"])
+        material = serializer.save()
+        # notify enrolled students in the background
+        enqueue(
+            "notifications.material_published",
+            {"material_id": str(material.id)},
+            key=f"material_published:{material.id}",
+        )
+
+    def perform_update(self, serializer):
+        # moving a material needs the target classroom too
+        if "classroom" in serializer.validated_data:
+            self.check_teaches(serializer.validated_data["classroom"])
         serializer.save()
 
+    def check_teaches(self, classroom):
+        if not get_membership(self.request).teaches(classroom.id):
+            raise PermissionDenied("only classroom teacher can add material")
 
-class SubmissionViewSet(viewsets.ModelViewSet):
+
+class SubmissionViewSet(
+    ReplicaReadMixin, FastListMixin, SparseFieldsMixin, viewsets.ModelViewSet
+):
     queryset = Submission.objects.all()
     serializer_class = SubmissionSerializer
+    list_mapper = SUBMISSION_MAPPER
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
-        serializer.save(student=self.request.user)
+        material = serializer.validated_data["material"]
+        if not get_membership(self.request).is_member(material.classroom_id):
+            raise PermissionDenied("not a member of this classroom")
+        submission = serializer.save(student=self.request.user)
+        thumbnails.schedule(submission.file.name)
+
+    def perform_update(self, serializer):
+        # moving a submission needs membership of the target classroom too
+        material = serializer.validated_data.get("material")
+        if material is not None and not get_membership(self.request).is_member(
+            material.classroom_id
+        ):
+            raise PermissionDenied("not a member of this classroom")
+        was = (serializer.instance.graded, serializer.instance.grade)
+        old_file = serializer.instance.file.name
+        if "file" in serializer.validated_data:
+            # the new file has no thumbnails until its task runs
+            submission = serializer.save(thumbnails_ready=False)
+        else:
+            submission = serializer.save()
+        if submission.file.name != old_file:
+            thumbnails.schedule(submission.file.name)
+        # only grading by the classroom teacher notifies the student
+        if (
+            submission.graded
+            and (submission.graded, submission.grade) != was
+            and get_membership(self.request).teaches(submission.material.classroom_id)
+        ):
+            enqueue(
+                "notifications.submission_graded",
+                {"submission_id": str(submission.id)},
+                # per update: regrading back to an earlier grade notifies again
+                key=f"submission_graded:{submission.id}:{timezone.now().isoformat()}",
+            )
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -123,27 +447,87 @@ class SubmissionViewSet(viewsets.ModelViewSet):
         user = self.request.user
         if user.is_teacher:
             # teacher submissions to their materials
-            return qs.filter(material__classroom__teacher=user)
+            taught = get_membership(self.request).taught
+            return qs.filter(material__classroom_id__in=taught)
         return qs.filter(student=user)
 
 
-class ClassChatMessageViewSet(viewsets.ReadOnlyModelViewSet, mixins.CreateModelMixin):
+class ClassChatMessageViewSet(
+    ReplicaReadMixin,
+    ChatHistoryMixin,
+    FastListMixin,
+    SparseFieldsMixin,
+    viewsets.ReadOnlyModelViewSet,
+    mixins.CreateModelMixin,
+):
     queryset = ClassChatMessage.objects.all()
     serializer_class = ClassChatMessageSerializer
+    list_mapper = CLASS_CHAT_MAPPER
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
+        material = serializer.validated_data["material"]
+        if not get_membership(self.request).is_member(material.classroom_id):
+            raise PermissionDenied("not a member of this classroom")
         serializer.save(sender=self.request.user)
 
     def get_queryset(self):
         material_id = self.request.query_params.get("material")
-        qs = super().get_queryset()
+        qs = (
+            super()
+            .get_queryset()
+            .filter(material__classroom_id__in=get_membership(self.request).member_ids)
+        )
         if material_id:
             qs = qs.filter(material_id=material_id).order_by("timestamp")
         return qs
 
+    def page_scope(self, request):
+        material_id = request.query_params.get("material")
+        if material_id and self.is_member_of_material(material_id):
+            return f"material:{material_id}"
+        return None
+
+    @cached_list
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def archived_rows(self, request, before, limit):
+        material_id = request.query_params.get("material")
+        if material_id and self.is_member_of_material(material_id):
+            return archived_class_messages(material_id, before, limit)
+        return []
 
-class DirectChatViewSet(viewsets.ModelViewSet):
+    def is_member_of_material(self, material_id):
+        return Material.objects.filter(
+            id=material_id,
+            classroom_id__in=get_membership(self.request).member_ids,
+        ).exists()
+
+    @action(detail=False, methods=["post"])
+    def read(self, request):
+        ser = ClassChatReadSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        material = ser.validated_data["material"]
+        mark_read(
+            request.user.id, ser.validated_data["last_read_id"], material_id=material.id
+        )
+        return Response({"detail": "read"})
+
+    @action(detail=False, methods=["get"])
+    def unread(self, request):
+        # ?material=<id>,<id>
+        material_ids = id_list(request, "material", serializers.UUIDField())
+        material_ids = Material.objects.filter(
+            id__in=material_ids,
+            classroom_id__in=get_membership(request).member_ids,
+        ).values_list("id", flat=True)
+        return Response(material_unread(request.user, list(material_ids)))
+
+
+class DirectChatViewSet(
+    ReplicaReadMixin, ChatHistoryMixin, SparseFieldsMixin, viewsets.ModelViewSet
+):
     queryset = DirectChatMessage.objects.all()
     serializer_class = DirectChatMessageSerializer
     permission_classes = [IsAuthenticated]
@@ -155,5 +539,67 @@ class DirectChatViewSet(viewsets.ModelViewSet):
         # return messages where user is participant
         user = self.request.user
         return DirectChatMessage.objects.filter(
-            models.Q(sender=user) | models.Q(recipient=user)
+            Q(sender=user) | Q(recipient=user)
         ).order_by("timestamp")
+
+    def page_scope(self, request):
+        return f"dm:{request.user.id}"
+
+    @cached_list
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def archived_rows(self, request, before, limit):
+        return archived_direct_messages(request.user.id, before, limit)
+
+    @action(detail=False, methods=["post"])
+    def read(self, request):
+        ser = DirectChatReadSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        peer = ser.validated_data["peer"]
+        mark_read(request.user.id, ser.validated_data["last_read_id"], peer_id=peer.id)
+        return Response({"detail": "read"})
+
+    @action(detail=False, methods=["get"])
+    def unread(self, request):
+        # ?peer=<id>,<id>, default: whoever messaged the user recently
+        peer_ids = None
+        if "peer" in request.query_params:
+            peer_ids = id_list(request, "peer", serializers.IntegerField())
+        return Response(direct_unread(request.user, peer_ids))
+
+
+class NotificationPagination(CursorPagination):
+    # keyset pagination on the (user, is_read, -id) index
+    ordering = "-id"
+    page_size = 50
+
+
+class NotificationViewSet(
+    ReplicaReadMixin, mixins.ListModelMixin, viewsets.GenericViewSet
+):
+    serializer_class = NotificationSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = NotificationPagination
+    # /api/notifications/abc/read/ -> 404, not a ValueError from filter(pk=...)
+    lookup_value_regex = r"\d+"
+
+    def get_queryset(self):
+        qs = Notification.objects.filter(user=self.request.user)
+        if self.request.query_params.get("unread") in ("1", "true"):
+            qs = qs.filter(is_read=False)
+        return qs
+
+    @action(detail=True, methods=["post"])
+    def read(self, request, pk=None):
+        updated = self.get_queryset().filter(pk=pk).update(is_read=True)
+        if not updated:
+            return Response({"detail": "not found"}, status=404)
+        return Response({"detail": "read"})
+
+    @action(detail=False, methods=["post"])
+    def read_all(self, request):
+        updated = Notification.objects.filter(user=request.user, is_read=False).update(
+            is_read=True
+        )
+        return Response({"detail": "read", "count": updated})
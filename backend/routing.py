@@ -9,4 +9,5 @@ websocket_urlpatterns = [
     re_path(
         r"ws/direct/(?P<other_user_id>\d+)/$", consumers.DirectChatConsumer.as_asgi()
     ),
+    re_path(r"ws/notifications/$", consumers.NotificationConsumer.as_asgi()),
 ]
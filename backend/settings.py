@@ -31,6 +31,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "api.compression.CompressionMiddleware",  # brotli/gzip
     "corsheaders.middleware.CorsMiddleware",  # cors
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -63,15 +64,65 @@ ASGI_APPLICATION = "backend.asgi.application"
 AUTH_USER_MODEL = "api.User"
 
 # channel
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {"hosts": [("127.0.0.1", 6379)]},
+# CHANNEL_LAYER=redis  -> one redis write per member channel on group_send
+# CHANNEL_LAYER=pubsub -> one publish per group, each node fans out to its own sockets
+# CHANNEL_LAYER=memory -> single process, no redis (local dev)
+# REDIS_HOSTS=redis://a:6379,redis://b:6379 shards channels/groups across hosts
+CHANNEL_LAYER = env("CHANNEL_LAYER", default="redis")
+REDIS_HOSTS = env.list("REDIS_HOSTS", default=["redis://127.0.0.1:6379"])
+
+if CHANNEL_LAYER == "memory":
+    CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+elif CHANNEL_LAYER == "pubsub":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+            "CONFIG": {"hosts": REDIS_HOSTS},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": REDIS_HOSTS,
+                "capacity": env.int("CHANNEL_CAPACITY", default=100),
+            },
+        }
     }
-}
 
 # db
 DATABASES = {"default": env.db("DATABASE_URL")}
+# keep connections open between requests, checked before reuse
+DATABASES["default"]["CONN_MAX_AGE"] = env.int("CONN_MAX_AGE", default=60)
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+# DB_POOL=True: psycopg 3 connection pool (postgres only), replaces CONN_MAX_AGE
+DB_POOL = env.bool("DB_POOL", default=False)
+if DB_POOL and "postgresql" in DATABASES["default"]["ENGINE"]:
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+        "min_size": env.int("DB_POOL_MIN_SIZE", default=2),
+        "max_size": env.int("DB_POOL_MAX_SIZE", default=10),
+        "timeout": env.int("DB_POOL_TIMEOUT", default=10),
+    }
+
+# cache, shared between workers in production e.g. CACHE_URL=rediscache://127.0.0.1:6379/1
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
+# read replicas: REPLICA_DATABASE_URLS=psql://...,psql://... (see api/dbrouting.py)
+for i, url in enumerate(env.list("REPLICA_DATABASE_URLS", default=[])):
+    DATABASES[f"replica{i}"] = {
+        **env.db_url_config(url),
+        "CONN_MAX_AGE": DATABASES["default"]["CONN_MAX_AGE"],
+        "CONN_HEALTH_CHECKS": True,
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_ROUTERS = ["api.dbrouting.ReplicaRouter"]
+# after a write, the user's reads stay on the primary for this long
+REPLICA_STICKY_SECONDS = env.int("REPLICA_STICKY_SECONDS", default=10)
+
+# open connections / build url resolvers when the worker starts (backend/warmup.py)
+WARMUP = env.bool("WARMUP", default=True)
 
 # drf jwt
 REST_FRAMEWORK = {
@@ -79,6 +130,10 @@ REST_FRAMEWORK = {
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
+    "DEFAULT_RENDERER_CLASSES": (
+        "api.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
 }
 
 SIMPLE_JWT = {
@@ -94,6 +149,13 @@ STATIC_ROOT = BASE_DIR / env("STATIC_DIR")
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / env("MEDIA_DIR")
 
+# background tasks: eager runs them in-process after commit (no worker)
+TASKS_EAGER = env.bool("TASKS_EAGER", default=False)
+
+# chat archive (gzipped jsonl of chat months older than CHAT_RETENTION_MONTHS)
+CHAT_ARCHIVE_DIR = BASE_DIR / env("CHAT_ARCHIVE_DIR", default="archive")
+CHAT_RETENTION_MONTHS = env.int("CHAT_RETENTION_MONTHS", default=12)
+
 LANGUAGE_CODE = "en-us"
 TIME_ZONE = "UTC"
 USE_I18N = True
@@ -0,0 +1,52 @@
+"""
+Worker warm-up, set up by backend/wsgi.py and backend/asgi.py after the
+application is built, so the first requests after a deploy don't pay for
+compiling URL patterns, importing views and opening connection pools.
+
+Only import-safe work runs at import time. Sockets and pool threads are
+opened on the first request each process serves: under ``gunicorn
+--preload`` the module is imported in the master and anything opened there
+would be shared by every forked worker.
+"""
+
+import logging
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import request_started
+from django.db import connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up(connect=True):
+    """
+    ``connect`` also opens the serving thread's database connections, which
+    only helps sync WSGI workers. Under ASGI requests run on executor threads
+    with their own connections, so asgi.py passes False and only connection
+    pools are opened.
+    """
+    if not getattr(settings, "WARMUP", True):
+        return
+    # compiles every url pattern and imports all views/serializers; done
+    # before a fork the workers share the pages
+    get_resolver().reverse_dict
+
+    def open_connections(**kwargs):
+        # once per process, in the worker
+        request_started.disconnect(dispatch_uid="warmup")
+        for alias in settings.CACHES:
+            caches[alias].get("warmup")
+        for alias in connections:
+            try:
+                pool = getattr(connections[alias], "pool", None)
+                if pool is not None:
+                    # DB_POOL: fills to min_size in the pool's own threads,
+                    # no connection stays checked out by this thread
+                    pool.open()
+                elif connect:
+                    connections[alias].ensure_connection()
+            except Exception:
+                logger.exception("warm-up could not connect to database %r", alias)
+
+    request_started.connect(open_connections, weak=False, dispatch_uid="warmup")